@@ -0,0 +1,63 @@
+import functools
+import mimetypes
+from pathlib import Path
+from typing import Tuple
+from urllib.parse import unquote, urlsplit
+
+from weasyprint import CSS, default_url_fetcher
+from weasyprint.text.fonts import FontConfiguration
+
+
+# Локальные ресурсы шаблона письма (reset.css и т.п.)
+ASSETS_DIR = Path(__file__).resolve().parent / "assets"
+ASSETS_URL = ASSETS_DIR.as_uri() + "/"
+
+# Фон письма лежит в корне сервиса, рядом с data_example.json
+BACKGROUND_PATH = Path(__file__).resolve().parent.parent / "background.png"
+
+
+@functools.lru_cache(maxsize=64)
+def read_asset(path: Path) -> bytes:
+    return path.read_bytes()
+
+
+def offline_url_fetcher(url, timeout=10, ssl_context=None):
+    """
+    url_fetcher для WeasyPrint без доступа в сеть.
+
+    Отдаёт data: URI, фон письма и файлы из ASSETS_DIR (содержимое кешируется в памяти процесса),
+    на любые другие адреса бросает ValueError - WeasyPrint пропускает такой ресурс.
+    """
+    if url.startswith("data:"):
+        return default_url_fetcher(url, timeout, ssl_context)
+
+    parts = urlsplit(url)
+    if parts.scheme == "file":
+        path = Path(unquote(parts.path)).resolve()
+        allowed = path == BACKGROUND_PATH or path.is_relative_to(ASSETS_DIR)
+        if allowed and path.is_file():
+            return {
+                "string": read_asset(path),
+                "mime_type": mimetypes.guess_type(path.name)[0],
+                "redirected_url": url,
+            }
+    raise ValueError(f"Загрузка внешних ресурсов запрещена: {url}")
+
+
+@functools.cache
+def get_font_config() -> FontConfiguration:
+    """Одна FontConfiguration на процесс: fontconfig не инициализируется заново на каждый документ"""
+    return FontConfiguration()
+
+
+@functools.cache
+def load_stylesheets(*names: str) -> Tuple[CSS, ...]:
+    """Стили из ASSETS_DIR, разобранные один раз на процесс; передаются в write_pdf(stylesheets=...)"""
+    return tuple(
+        CSS(
+            filename=str(ASSETS_DIR / name),
+            url_fetcher=offline_url_fetcher,
+            font_config=get_font_config()
+        )
+        for name in names
+    )
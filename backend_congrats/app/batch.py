@@ -0,0 +1,50 @@
+import io
+import re
+from typing import List
+
+from pypdf import PdfWriter
+
+
+class ZipStreamBuffer(io.RawIOBase):
+    """
+    Приёмник для zipfile без seek/tell: накопленные байты забираются через pop()
+    и сразу уходят клиенту, архив целиком в памяти не держится.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def pop(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def letter_arcname(index: int, letter_data: dict) -> str:
+    """Имя письма внутри архива: порядковый номер и получатель"""
+    recipient = letter_data["recipient"]
+    if letter_data["entityType"] == "individual":
+        name = f"{recipient['lastName']} {recipient['firstName']} {recipient['middleName']}"
+    else:
+        name = recipient["companyName"]
+    name = re.sub(r"[^\w\-]+", "_", name).strip("_")[:100]
+    return f"{index + 1:03d}_{name or 'letter'}.pdf"
+
+
+def merge_pdfs(paths: List[str]) -> bytes:
+    """Склейка писем в один PDF; одинаковые объекты (фон, шрифты) сохраняются один раз"""
+    writer = PdfWriter()
+    for path in paths:
+        writer.append(path)
+    writer.compress_identical_objects()
+    output = io.BytesIO()
+    writer.write(output)
+    return output.getvalue()
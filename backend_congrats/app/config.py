@@ -1,4 +1,6 @@
 import os
+from typing import Optional
+
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -7,4 +9,23 @@ class Settings(BaseSettings):
         env_file=os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".env")
     )
 
+    # Кеш готовых писем в media/: старые файлы удаляются по возрасту и по суммарному размеру
+    letter_cache_max_age_days: int = 30
+    letter_cache_max_bytes: int = 1024 * 1024 * 1024
+
+    # Пул процессов для генерации писем и ограничение размера пачки
+    render_workers: int = os.cpu_count() or 1
+    batch_max_letters: int = 200
+
+    # Период проверки файлов шаблона (data_example.json, фон, стили) на изменения, 0 - не проверять
+    template_reload_interval: float = 5
+
+    # Профилирование генерации по заголовку X-Profile: 1; статистика cProfile сохраняется в profile_dir
+    profile_requests: bool = False
+    profile_dir: str = "profiles"
+
+    # Префикс internal-location nginx (например /internal/congrats-media/): файлы из media/ отдаёт nginx
+    # по X-Accel-Redirect, а не воркер приложения. Не задан - файлы отдаёт приложение
+    media_accel_prefix: Optional[str] = None
+
 settings = Settings()
@@ -0,0 +1,97 @@
+import contextlib
+import hashlib
+import json
+import os
+import time
+import uuid
+from typing import Optional
+
+
+LETTER_PREFIX = "letter_"
+EVICTION_INTERVAL = 60
+
+
+def letter_key(letter_data: dict, template_version: str) -> str:
+    """Канонический хеш данных письма: одинаковые запросы к одной версии шаблона дают одно имя файла"""
+    canonical = json.dumps(letter_data, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(f"{template_version}:{canonical}".encode()).hexdigest()
+
+
+class LetterCache:
+    """Готовые письма в media/ под именем letter_<хеш>.pdf вместо нового uuid на каждый запрос"""
+
+    def __init__(self, media_dir: str, max_age_days: int, max_bytes: int):
+        self.media_dir = media_dir
+        self.max_age = max_age_days * 24 * 60 * 60
+        self.max_bytes = max_bytes
+        self._last_eviction = float("-inf")
+
+    def filename(self, letter_data: dict, template_version: str) -> str:
+        return f"{LETTER_PREFIX}{letter_key(letter_data, template_version)}.pdf"
+
+    def get(self, letter_data: dict, template_version: str) -> Optional[str]:
+        filename = self.filename(letter_data, template_version)
+        filepath = os.path.join(self.media_dir, filename)
+        try:
+            # Обновляем mtime: при вытеснении по размеру первыми удаляются давно не запрошенные письма
+            os.utime(filepath)
+        except FileNotFoundError:
+            return None
+        return filename
+
+    @contextlib.contextmanager
+    def write(self, filename: str):
+        """
+        Запись нового письма в кеш: отдаёт временный путь для рендера.
+
+        По выходу из блока файл переименовывается в letter_<хеш>.pdf, чтобы по ссылке
+        никогда не отдавался недописанный PDF; при ошибке временный файл удаляется.
+        """
+        os.makedirs(self.media_dir, exist_ok=True)
+        tmp_path = os.path.join(self.media_dir, f".{filename}.{uuid.uuid4().hex}.tmp")
+        try:
+            yield tmp_path
+            os.replace(tmp_path, os.path.join(self.media_dir, filename))
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        self.maybe_evict(keep=filename)
+
+    def maybe_evict(self, keep: Optional[str] = None):
+        # Каталог сканируется не чаще раза в EVICTION_INTERVAL, а не после каждого письма пачки
+        if time.monotonic() - self._last_eviction >= EVICTION_INTERVAL:
+            self._last_eviction = time.monotonic()
+            self.evict(keep=keep)
+
+    def evict(self, keep: Optional[str] = None):
+        """Удаление писем старше max_age, затем самых старых - пока суммарный размер больше max_bytes"""
+        letters = []
+        now = time.time()
+        with os.scandir(self.media_dir) as entries:
+            for entry in entries:
+                if not (entry.name.startswith(LETTER_PREFIX) and entry.name.endswith(".pdf")):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                if entry.name != keep and now - stat.st_mtime > self.max_age:
+                    self._remove(entry.path)
+                    continue
+                letters.append((stat.st_mtime, stat.st_size, entry.name, entry.path))
+
+        total = sum(size for _, size, _, _ in letters)
+        for _, size, name, path in sorted(letters):
+            if total <= self.max_bytes:
+                break
+            if name == keep:
+                continue
+            self._remove(path)
+            total -= size
+
+    @staticmethod
+    def _remove(path: str):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
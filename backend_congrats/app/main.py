@@ -1,19 +1,43 @@
+import asyncio
+import functools
+import logging
+import multiprocessing
 import os
 import uuid
-import json
-from typing import Annotated, Union, Literal
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Annotated, Union, Literal, List, Optional
 
 from pydantic import BaseModel
-from fastapi import FastAPI, Request, Depends
-from fastapi.staticfiles import StaticFiles
+from fastapi import FastAPI, Request, Depends, HTTPException
+from fastapi.responses import FileResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 
 from app.config import settings
-from app.pdf_creater import generate_pdf_report
+from app.pdf_creater import generate_pdf_bytes, generate_pdf_report, warm_up
+from app.letter_cache import LetterCache
+from app.media import MediaFiles
+from app.profiling import PROFILE_HEADER, observe_stages
+from app.batch import ZipStreamBuffer, letter_arcname, merge_pdfs
+from app.template_context import TemplateContext, load_template_context, watch_template
 
 
 app = FastAPI()
-app.mount("/api/congrats/media", StaticFiles(directory="media"), name="media")
+app.mount(
+    "/api/congrats/media",
+    MediaFiles(directory="media", accel_prefix=settings.media_accel_prefix),
+    name="media"
+)
+letter_cache = LetterCache(
+    "media",
+    max_age_days=settings.letter_cache_max_age_days,
+    max_bytes=settings.letter_cache_max_bytes
+)
+render_pool: Optional[ProcessPoolExecutor] = None
+template_context: Optional[TemplateContext] = None
+background_tasks = set()
 
 app.add_middleware(
     CORSMiddleware,
@@ -25,11 +49,64 @@ app.add_middleware(
 )
 
 
+def create_render_pool() -> ProcessPoolExecutor:
+    # spawn, а не fork: родительский процесс уже держит потоки uvicorn
+    return ProcessPoolExecutor(
+        max_workers=settings.render_workers,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=warm_up
+    )
+
+
+async def reload_template(context: TemplateContext):
+    """Новый контекст шаблона и новый пул: воркеры заново загружают стили и фон"""
+    global render_pool, template_context
+    old_pool = render_pool
+    render_pool = create_render_pool()
+    template_context = context
+    # Уже отправленные в старый пул письма дорабатываются, новые идут в новый пул
+    old_pool.shutdown(wait=False)
+
+
+@app.on_event("startup")
+async def startup_event():
+    global render_pool, template_context
+    template_context = load_template_context()
+    render_pool = create_render_pool()
+    if settings.template_reload_interval > 0:
+        task = asyncio.create_task(
+            watch_template(template_context, reload_template, settings.template_reload_interval)
+        )
+        background_tasks.add(task)
+        task.add_done_callback(background_tasks.discard)
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    for task in background_tasks:
+        task.cancel()
+    render_pool.shutdown(wait=False, cancel_futures=True)
+
+
 @app.get("/api/congrats/ping")
 async def ping():
     return {"message": "Pong"}
 
 
+@app.get("/api/congrats/metrics")
+async def metrics():
+    """Метрики Prometheus, в том числе длительность этапов генерации PDF"""
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
+def requested_profile_path(request: Request) -> Optional[str]:
+    """Путь для статистики cProfile, если клиент прислал X-Profile: 1 и профилирование включено"""
+    if not settings.profile_requests or request.headers.get(PROFILE_HEADER) != "1":
+        return None
+    os.makedirs(settings.profile_dir, exist_ok=True)
+    return os.path.join(settings.profile_dir, f"letter_{uuid.uuid4().hex}.pstats")
+
+
 class IndividualRecipient(BaseModel):
     lastName: str
     firstName: str
@@ -45,21 +122,145 @@ class LetterRequest(BaseModel):
     recipient: Union[IndividualRecipient, LegalEntityRecipient]
 
 
-@app.post("/api/congrats/generate_letter")
-async def create_pdf(letter_request: LetterRequest, request: Request):
-    letter_filename = f"letter_{uuid.uuid4()}.pdf"
-    letter_filepath = os.path.join("media", letter_filename)
-    
-    # Ensure the media directory exists
-    os.makedirs("media", exist_ok=True)
-    
-    with open("data_example.json", 'r', encoding='utf-8') as file:
-        example_dict = json.load(file)
+class BatchLetterRequest(BaseModel):
+    letters: List[LetterRequest]
+    format: Literal["zip", "pdf"] = "zip"
+
+
+async def render_letter(letter_data: dict, context: TemplateContext, profile_path: Optional[str] = None) -> str:
+    """Имя файла письма в media/: из кеша или после генерации в пуле процессов"""
+    letter_filename = letter_cache.get(letter_data, context.version)
+    if letter_filename:
+        return letter_filename
+
+    letter_filename = letter_cache.filename(letter_data, context.version)
+    loop = asyncio.get_running_loop()
+    with letter_cache.write(letter_filename) as tmp_path:
+        timings = await loop.run_in_executor(
+            render_pool, functools.partial(generate_pdf_report, letter_data, tmp_path, profile_path=profile_path)
+        )
+    observe_stages(timings)
+    return letter_filename
+
 
+async def render_letter_bytes(letter_data: dict, context: TemplateContext, profile_path: Optional[str] = None) -> bytes:
+    """Письмо генерируется в память и отдаётся сразу; в кеш media/ оно записывается уже после генерации"""
+    loop = asyncio.get_running_loop()
+    pdf, timings = await loop.run_in_executor(
+        render_pool, functools.partial(generate_pdf_bytes, letter_data, profile_path=profile_path)
+    )
+    observe_stages(timings)
+    with letter_cache.write(letter_cache.filename(letter_data, context.version)) as tmp_path:
+        await asyncio.to_thread(Path(tmp_path).write_bytes, pdf)
+    return pdf
+
+
+@app.post("/api/congrats/generate_letter")
+async def create_pdf(
+        letter_request: LetterRequest,
+        request: Request,
+        response: Response,
+        delivery: Literal["link", "inline"] = "link"
+):
+    """Письмо; delivery=inline - PDF в теле ответа вместо ссылки на него"""
+    context = template_context
     request_dict = letter_request.dict()
-    request_dict["sender"] = example_dict["sender"]
-    
-    # Assuming generate_pdf_report writes the PDF to letter_filepath
-    generate_pdf_report(request_dict, letter_filepath)
-    
+    request_dict["sender"] = context.sender
+
+    if delivery == "inline":
+        return await create_pdf_inline(request_dict, context, request, response)
+
+    # Одинаковые письма (получатель, тип, дата, отправитель, версия шаблона) не перегенерируются
+    profile_path = requested_profile_path(request)
+    letter_filename = await render_letter(request_dict, context, profile_path)
+    # Письмо из кеша не генерировалось - профиля нет
+    if profile_path and os.path.exists(profile_path):
+        response.headers["X-Profile-File"] = os.path.basename(profile_path)
+
     return {"status": "Success", "message": f"{request.base_url}api/congrats/media/{letter_filename}".replace('http:', 'https:')}
+
+
+async def create_pdf_inline(letter_data: dict, context: TemplateContext, request: Request, response: Response):
+    headers = {"Content-Disposition": 'inline; filename="letter.pdf"'}
+    letter_filename = letter_cache.get(letter_data, context.version)
+    if letter_filename:
+        return FileResponse(os.path.join("media", letter_filename), media_type="application/pdf", headers=headers)
+
+    profile_path = requested_profile_path(request)
+    pdf = await render_letter_bytes(letter_data, context, profile_path)
+    if profile_path and os.path.exists(profile_path):
+        headers["X-Profile-File"] = os.path.basename(profile_path)
+    return Response(pdf, media_type="application/pdf", headers=headers)
+
+
+@app.post("/api/congrats/generate_letters")
+async def create_pdf_batch(batch_request: BatchLetterRequest):
+    """
+    Пачка писем за один запрос: письма генерируются параллельно в пуле процессов.
+
+    format=zip - архив отдаётся потоком по мере готовности писем (порядок файлов в архиве
+    по готовности, в имени - номер письма в запросе); format=pdf - все письма одним PDF.
+    """
+    if not batch_request.letters:
+        raise HTTPException(status_code=422, detail="Список писем пуст")
+    if len(batch_request.letters) > settings.batch_max_letters:
+        raise HTTPException(
+            status_code=413,
+            detail=f"В одной пачке не больше {settings.batch_max_letters} писем"
+        )
+
+    # Отправитель и версия шаблона одни на всю пачку, даже если шаблон перезагрузится посреди неё
+    context = template_context
+    letters = []
+    for letter_request in batch_request.letters:
+        letter_data = letter_request.dict()
+        letter_data["sender"] = context.sender
+        letters.append(letter_data)
+
+    if batch_request.format == "pdf":
+        filenames = await asyncio.gather(*(render_letter(letter_data, context) for letter_data in letters))
+        loop = asyncio.get_running_loop()
+        merged = await loop.run_in_executor(
+            render_pool, merge_pdfs, [os.path.join("media", filename) for filename in filenames]
+        )
+        return Response(
+            merged,
+            media_type="application/pdf",
+            headers={"Content-Disposition": 'attachment; filename="letters.pdf"'}
+        )
+
+    return StreamingResponse(
+        stream_letters_zip(letters, context),
+        media_type="application/zip",
+        headers={"Content-Disposition": 'attachment; filename="letters.zip"'}
+    )
+
+
+async def stream_letters_zip(letters: List[dict], context: TemplateContext):
+    async def render_indexed(index: int, letter_data: dict):
+        try:
+            return index, await render_letter(letter_data, context), None
+        except Exception as e:
+            logging.exception('Ошибка при генерации письма из пачки')
+            return index, None, str(e) or type(e).__name__
+
+    tasks = [asyncio.create_task(render_indexed(index, letter_data)) for index, letter_data in enumerate(letters)]
+    buffer = ZipStreamBuffer()
+    errors = []
+    try:
+        # PDF уже сжат, поэтому ZIP_STORED: архивирование не нагружает процессор
+        with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_STORED) as archive:
+            for task in asyncio.as_completed(tasks):
+                index, letter_filename, error = await task
+                if error:
+                    errors.append(f"{letter_arcname(index, letters[index])}: {error}")
+                    continue
+                archive.write(os.path.join("media", letter_filename), letter_arcname(index, letters[index]))
+                yield buffer.pop()
+            if errors:
+                archive.writestr("errors.txt", "\n".join(errors))
+        yield buffer.pop()
+    finally:
+        # Клиент мог оборвать загрузку - незапущенные письма не генерируем
+        for task in tasks:
+            task.cancel()
@@ -1,8 +1,24 @@
+import io
 import json
 import os
 
 from weasyprint import HTML
 
+from app.assets import ASSETS_URL, BACKGROUND_PATH, offline_url_fetcher, read_asset, get_font_config, load_stylesheets
+from app.profiling import measure_stages, stage
+
+# Статические стили письма из app/assets, порядок важен
+LETTER_STYLESHEETS = ("reset.css", "letter.css")
+
+# Кеш декодированных изображений WeasyPrint на весь процесс: фон письма разбирается один раз
+IMAGE_CACHE = {}
+
+
+def warm_up():
+    """Прогрев процесса-воркера: стили и фон письма загружаются один раз, до первого письма"""
+    load_stylesheets(*LETTER_STYLESHEETS)
+    read_asset(BACKGROUND_PATH)
+
 
 def __load_json_data(filename):
     with open(filename, 'r', encoding='utf-8') as file:
@@ -32,135 +48,6 @@ def __format_date(date_str: str) -> str:
         raise ValueError(f"Некорректный формат даты: {date_str}") from e
 
 
-STYLE_CSS = f"""
-<style>
-    * {{ -webkit-font-smoothing: antialiased; box-sizing: border-box; }}
-    body {{
-        font-family: 'Geologica', 
-        sans-serif; font-size: 14px; 
-        line-height: 12.2px; 
-        margin: 496px 84px 308px 231px; /* Отступы для содержимого */
-    }}
-    @page {{
-        size: 1191px 1684px;
-        margin: 0;
-        background-image: url("file://{os.path.abspath('background.png')}");
-		background-position: center;
-		background-repeat: no-repeat;
-	}}
-    .content {{
-        padding-top: 20px;
-        font-weight: 100;
-        line-height: 1;
-        height: 840px;
-        display: flex;
-        flex-direction: column;        /* располагаем элементы по вертикали */
-        justify-content: space-between; /* равные промежутки между элементами */
-       
-    }}
-    .receiver h1 {{
-        font-size: 44px;
-        color: #2d3a67;
-        text-align: center;
-    }}
-    .receiver h1.surname {{
-        font-size: 52px;
-        font-weight: bold;
-        margin-bottom: 0;
-    }}
-    .receiver h1.company_name {{
-        font-size: 52px;
-        font-weight: bold;
-        margin-bottom: 0;
-        margin-left: 138px;
-        margin-right: 138px;
-        overflow-wrap: break-word;   /* перенос длинных слов */
-        word-break: keep-all;        /* не режем слова посередине (для русского — лучше) */
-        width: 600px;
-    }}
-    .receiver {{
-        margin-bottom: 0;
-    }}
-
-    .sender_container {{
-        display: flex;
-        justify-content: space-between;
-    }}    
-
-    .sender h1 {{
-        font-size: 38px;
-        color: #2d3a67;
-        text-align: left;
-    }}
-    .sender h1.surname {{
-        font-size: 42px;
-        font-weight: bold;
-    }}
-    
-    .sender h1.name {{
-        margin-right: 30px;
-    }}
-    h4 {{
-        color: #2d3a67;
-        text-align: center;
-        font-size: 22px;
-        margin-bottom: 12px;
-        padding-top: 19.9px;
-        font-weight: 200;
-    }}
-    p {{
-        font-size: 24px;
-        line-height: 1.25;
-        margin-bottom: 12px;
-        font-weight: 300;
-    }}
-    .sender p {{
-        font-size: 20px;
-        color: #2d3a67;
-        margin-right: 30px;
-    }}
-    .congratulations_text {{
-        text-align: center;
-  transform: scaleY(1.3);        /* Вытягиваем по вертикали на 30% */
-  transform-origin: center;      /* Точка трансформации — центр */
-    }}
-    .sender {{
-        text-align: left;
-    }}
-    .date {{
-        color: #2d3a67;
-        font-size: 20px;
-        text-align: center;
-        margin-top: 2px;
-        font-weight: 400;
-    }}
-    .signature {{
-        text-align: center;
-        flex: 1; /* 🚀 Занимает ВСЁ свободное пространство */
-    }}
-    .signature img {{
-        text-align: center;
-        height: 160px;
-    }}
-
-    .surname-line {{
-        display: flex;
-        align-items: center;
-        gap: 10px; /* небольшой отступ между фамилией и полосой (по желанию) */
-        margin-bottom: 8px;
-    }}
-
-    .yellow-stripe {{
-        flex: 1;
-        height: 4px;
-        background-color: #FFD700; 
-        min-width: 30px; 
-        align-self: center;
-    }}
-</style>
-"""
-
-
 def generate_html_report(data):
     images_paths = []
     if data["entityType"] == "individual":
@@ -185,10 +72,6 @@ def generate_html_report(data):
     <head>
         <meta charset="UTF-8">
         <title>Поздравительное письмо</title>
-        <link href="https://fonts.googleapis.com/css2?family=Geologica:wght@100;200;300;400;500;600&display=swap" rel="stylesheet">
-        <link href="https://fonts.googleapis.com/css2?family=Bebas+Neue&display=swap" rel="stylesheet">
-        <link href="https://cdnjs.cloudflare.com/ajax/libs/meyer-reset/2.0/reset.min.css" rel="stylesheet">
-        {STYLE_CSS}
     </head>
     <body>
         <div class="content">
@@ -229,11 +112,32 @@ def generate_html_report(data):
     return html_content, images_paths
 
 
-def generate_pdf_report(json_data, output_filename, debug=False):
-    html_content, images_paths = generate_html_report(json_data)
+def generate_pdf_report(json_data, output_filename, debug=False, profile_path=None):
+    """Генерация PDF; возвращает длительность этапов в секундах (html, layout, write, total)"""
+    return measure_stages(_generate_pdf_report, json_data, output_filename, debug, profile_path=profile_path)
+
+
+def generate_pdf_bytes(json_data, profile_path=None):
+    """Генерация PDF в память; возвращает байты PDF и длительность этапов"""
+    buffer = io.BytesIO()
+    timings = generate_pdf_report(json_data, buffer, profile_path=profile_path)
+    return buffer.getvalue(), timings
+
+
+def _generate_pdf_report(json_data, output_filename, debug):
+    with stage("html"):
+        html_content, images_paths = generate_html_report(json_data)
 
     try:
-        HTML(string=html_content).write_pdf(output_filename)
+        # Шрифты установлены в образ, остальные ресурсы берутся из app/assets - сеть при рендере не нужна
+        with stage("layout"):
+            document = HTML(string=html_content, base_url=ASSETS_URL, url_fetcher=offline_url_fetcher).render(
+                stylesheets=load_stylesheets(*LETTER_STYLESHEETS),
+                font_config=get_font_config(),
+                cache=IMAGE_CACHE
+            )
+        with stage("write"):
+            document.write_pdf(output_filename)
         if debug:
             with open("debug.html", "w", encoding="utf-8") as f:
                 f.write(html_content)
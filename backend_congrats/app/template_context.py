@@ -0,0 +1,75 @@
+import asyncio
+import hashlib
+import json
+import logging
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Awaitable, Callable, List, Tuple
+
+from app.assets import ASSETS_DIR, BACKGROUND_PATH
+
+
+APP_DIR = Path(__file__).resolve().parent
+SENDER_PATH = APP_DIR.parent / "data_example.json"
+PDF_CREATER_PATH = APP_DIR / "pdf_creater.py"
+
+
+def template_files() -> List[Path]:
+    """Файлы, от которых зависит вид письма"""
+    return [PDF_CREATER_PATH, SENDER_PATH, BACKGROUND_PATH, *sorted(ASSETS_DIR.rglob("*"))]
+
+
+def files_signature() -> Tuple:
+    signature = []
+    for path in template_files():
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            continue
+        signature.append((str(path), stat.st_mtime_ns, stat.st_size))
+    return tuple(signature)
+
+
+@dataclass(frozen=True)
+class TemplateContext:
+    """
+    Всё, что нужно письму помимо данных получателя; загружается при старте и при изменении файлов.
+
+    sender не копируется в каждое письмо, поэтому его нельзя изменять.
+    """
+    sender: dict
+    version: str
+    signature: Tuple
+
+
+def load_template_context() -> TemplateContext:
+    signature = files_signature()
+    digest = hashlib.sha256()
+    for path in template_files():
+        if path.is_file():
+            digest.update(path.name.encode())
+            digest.update(path.read_bytes())
+
+    with open(SENDER_PATH, 'r', encoding='utf-8') as file:
+        sender = json.load(file)["sender"]
+    return TemplateContext(sender=sender, version=digest.hexdigest()[:16], signature=signature)
+
+
+async def watch_template(
+        context: TemplateContext,
+        on_change: Callable[[TemplateContext], Awaitable[None]],
+        interval: float
+):
+    """Опрос mtime файлов шаблона; при изменении загружает новый контекст и передаёт его в on_change"""
+    while True:
+        await asyncio.sleep(interval)
+        if files_signature() == context.signature:
+            continue
+        try:
+            context = load_template_context()
+        except Exception:
+            # Файл могли сохранить не до конца - попробуем на следующем круге
+            logging.exception('Не удалось перезагрузить шаблон письма')
+            continue
+        logging.info('Шаблон письма изменён, версия %s', context.version)
+        await on_change(context)
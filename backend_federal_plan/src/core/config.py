@@ -21,4 +21,7 @@ log_format = os.getenv("LOG_FORMAT", "%(asctime)s - %(name)s - %(levelname)s - %
 
 
 ALGORITHM = os.getenv("ALGORITHM", "RS256")
-PUBLIC_KEY = get_secret('jwt_public_key', "")
\ No newline at end of file
+PUBLIC_KEY = get_secret('jwt_public_key', "")
+# Кеш проверенных токенов: число токенов и максимальное время жизни записи (с), 0 - без кеша
+JWT_CACHE_SIZE = int(os.getenv("JWT_CACHE_SIZE", 1024))
+JWT_CACHE_TTL = float(os.getenv("JWT_CACHE_TTL", 300))
\ No newline at end of file
@@ -1,7 +1,7 @@
 from src.core.di import DeclarativeContainer, providers
 from src.domain.interfaces import IUnitOfWork, \
     IJWTRepository, IDayRepository
-from src.infrastructure import Database, UnitOfWork
+from src.infrastructure import Database, UnitOfWork, VerifiedTokenCache
 from src.infrastructure.interfaces import IDatabase
 from src.infrastructure.repositories import (
     JWTRepository, DayRepository
@@ -19,8 +19,11 @@ class Container(DeclarativeContainer):
     uow: providers.Singleton[IUnitOfWork] = providers.Singleton(
         UnitOfWork, database=database
     )
+    token_cache: providers.Singleton[VerifiedTokenCache] = providers.Singleton(
+        VerifiedTokenCache, max_size=config.JWT_CACHE_SIZE, ttl=config.JWT_CACHE_TTL
+    )
     jwt_repository: providers.Factory[IJWTRepository] = providers.Factory(
-        JWTRepository, public_key=config.PUBLIC_KEY, algorithm=config.ALGORITHM
+        JWTRepository, public_key=config.PUBLIC_KEY, algorithm=config.ALGORITHM, token_cache=token_cache
     )
     day_repository: providers.Factory[IDayRepository] = providers.Factory(
         DayRepository, uow=uow
@@ -2,10 +2,12 @@ from . import interfaces
 from . import models
 from .database import Database
 from .unit_of_work import UnitOfWork
+from .jwt_cache import VerifiedTokenCache
 
 __all__ = [
     'Database',
     'UnitOfWork',
+    'VerifiedTokenCache',
 
     'models',
     'interfaces'
@@ -1,25 +1,38 @@
+import functools
 import logging
 from datetime import timedelta, datetime, UTC
 from typing import Optional
 from dataclasses import asdict
 
-from jose import jwt
+from jose import jwk, jwt
 
 from src.domain.entities import User
 from src.domain.exceptions import AuthError
 from src.domain.interfaces import IJWTRepository
+from src.infrastructure.jwt_cache import VerifiedTokenCache
+
+
+@functools.cache
+def load_public_key(public_key: str, algorithm: str) -> jwk.Key:
+    """Ключ разбирается из PEM один раз на процесс, а не при каждой проверке подписи"""
+    return jwk.construct(public_key, algorithm)
 
 
 class JWTRepository(IJWTRepository):
     __public_key: str
     __algorithm: str
+    __token_cache: VerifiedTokenCache
 
-    def __init__(self, public_key, algorithm):
+    def __init__(self, public_key, algorithm, token_cache: VerifiedTokenCache):
         self.__public_key = public_key
         self.__algorithm = algorithm
+        self.__token_cache = token_cache
+
+    def __decode(self, token: str) -> dict:
+        return jwt.decode(token, load_public_key(self.__public_key, self.__algorithm), algorithms=[self.__algorithm])
 
     async def decode_access_token(self, token: str) -> User:
-        payload = jwt.decode(token, self.__public_key, algorithms=[self.__algorithm])
+        payload = self.__token_cache.verify(token, self.__decode)
         if int(payload.get('exp')) < datetime.now(UTC).timestamp():
             raise AuthError('Токен истёк')
         if 'user_id' not in payload or 'role' not in payload or 'login' not in payload:
@@ -1,9 +1,11 @@
+import functools
 import jwt
 import logging
 from datetime import datetime, timezone
 from fastapi import Header, HTTPException, status, Depends
 from pydantic import BaseModel
-from src.config import PUBLIC_KEY, ALGORITHM
+from src.config import PUBLIC_KEY, ALGORITHM, JWT_CACHE_SIZE, JWT_CACHE_TTL
+from src.jwt_cache import VerifiedTokenCache
 
 
 class User(BaseModel):
@@ -16,6 +18,19 @@ class AuthError(Exception):
     pass
 
 
+token_cache = VerifiedTokenCache(max_size=JWT_CACHE_SIZE, ttl=JWT_CACHE_TTL)
+
+
+@functools.cache
+def get_public_key():
+    """Ключ разбирается из PEM один раз, а не при каждой проверке подписи"""
+    return jwt.algorithms.get_default_algorithms()[ALGORITHM].prepare_key(PUBLIC_KEY)
+
+
+def decode_token(token: str) -> dict:
+    return jwt.decode(token, get_public_key(), algorithms=[ALGORITHM])
+
+
 async def get_current_admin(
         token: str = Header(..., alias="Authorization")
 ) -> User:
@@ -23,7 +38,7 @@ async def get_current_admin(
         token = token[7:]
 
     try:
-        payload = jwt.decode(token, PUBLIC_KEY, algorithms=[ALGORITHM])
+        payload = token_cache.verify(token, decode_token)
 
         if int(payload.get('exp', 0)) < datetime.now(timezone.utc).timestamp():
             raise AuthError('Токен истёк')
@@ -1,7 +1,13 @@
+import asyncio
+import hashlib
+import logging
+from collections import deque
 from datetime import datetime
 
 from celery import Celery
-from src.config import REDIS_URL
+from prometheus_client import Counter
+from src.config import REDIS_URL, LOG_QUEUE_SIZE, LOG_BATCH_SIZE, LOG_FLUSH_INTERVAL, LOG_OVERFLOW
+from src.database import canonical_payload
 from typing import Optional, Dict, Any, List
 
 client = Celery(
@@ -19,6 +25,41 @@ client.conf.update(
 )
 
 
+SEND_LOG_TASK = 'src.tasks.send_log_to_telegram'
+
+# При переполнении очереди логов: отбросить самое старое событие или новое
+LOG_OVERFLOW_DROP_OLDEST = 'drop_oldest'
+LOG_OVERFLOW_DROP_NEW = 'drop_new'
+
+LOG_EVENTS_DROPPED = Counter(
+    "report_log_events_dropped_total",
+    "События логов, не отправленные в брокер (переполнение очереди или ошибка отправки)",
+    ["reason"]
+)
+
+
+# Версия схемы extra у логов об отчётах; tg_bot по record_id строит ссылку на отчёт в админке
+REPORT_REF_SCHEMA = 'report_ref/1'
+
+
+def report_reference(record_id: int, user_id: int, data: Dict[str, Any], **fields) -> Dict[str, Any]:
+    """
+    extra для лога об отчёте: ссылка на запись вместо самих данных.
+
+    size и sha256 - размер и хеш канонического JSON данных (sha256 совпадает с records.fingerprint);
+    полный отчёт оператор открывает по record_id.
+    """
+    payload = canonical_payload(data)
+    return {
+        'schema': REPORT_REF_SCHEMA,
+        'record_id': record_id,
+        'user_id': user_id,
+        'size': len(payload),
+        'sha256': hashlib.sha256(payload).hexdigest(),
+        **fields,
+    }
+
+
 class CeleryTaskClient:
     @staticmethod
     def create_log_data(
@@ -60,6 +101,122 @@ class CeleryTaskClient:
         if custom_chat_id:
             log_data['custom_chat_id'] = custom_chat_id
 
-        task = client.send_task('src.tasks.send_log_to_telegram', args=[log_data])
+        task = client.send_task(SEND_LOG_TASK, args=[log_data])
         return task.id
 
+
+def publish_logs(batch: List[Dict[str, Any]]):
+    """Отправка пачки логов через одно соединение с брокером из пула"""
+    with client.producer_or_acquire() as producer:
+        for log_data in batch:
+            client.send_task(SEND_LOG_TASK, args=[log_data], producer=producer)
+
+
+class AsyncLogQueue:
+    """
+    Очередь логов в памяти процесса: обработчик запроса только кладёт событие,
+    в брокер события уходят пачками из фоновой задачи, в отдельном потоке.
+
+    Размер очереди ограничен max_size; при переполнении событие отбрасывается по политике
+    overflow. Если брокер недоступен, пачка отбрасывается, остальные события ждут следующего круга.
+    """
+
+    def __init__(
+            self,
+            max_size: int = LOG_QUEUE_SIZE,
+            batch_size: int = LOG_BATCH_SIZE,
+            flush_interval: float = LOG_FLUSH_INTERVAL,
+            overflow: str = LOG_OVERFLOW
+    ):
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow = overflow
+        self._events = deque()
+        self._in_flight = 0
+        self._stopping = False
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self, timeout: float = 5):
+        """
+        Остановка: фоновая задача дописывает текущую пачку и остаток очереди, но не дольше timeout секунд.
+
+        Что не успело уйти в брокер, включая пачку, прерванную на середине, считается в метрике как shutdown.
+        """
+        self._stopping = True
+        if self._task:
+            task, self._task = self._task, None
+            self._wakeup.set()
+        else:
+            task = asyncio.create_task(self.flush())
+        try:
+            # По таймауту wait_for отменяет задачу и дожидается её завершения
+            await asyncio.wait_for(task, timeout)
+        except asyncio.TimeoutError:
+            pass
+        lost = len(self._events) + self._in_flight
+        if lost:
+            LOG_EVENTS_DROPPED.labels(reason="shutdown").inc(lost)
+
+    def put(
+            self,
+            message: str,
+            level: str = 'INFO',
+            log_id: Optional[str] = None,
+            extra_data: Optional[Dict[str, Any]] = None,
+            custom_chat_id: Optional[int] = None
+    ) -> str:
+        """Постановка лога в очередь без обращения к брокеру; возвращает log_id"""
+        log_data = CeleryTaskClient.create_log_data(
+            message=message,
+            level=level,
+            log_id=log_id,
+            extra_data=extra_data
+        )
+        if custom_chat_id:
+            log_data['custom_chat_id'] = custom_chat_id
+
+        if len(self._events) >= self.max_size:
+            LOG_EVENTS_DROPPED.labels(reason="overflow").inc()
+            if self.overflow == LOG_OVERFLOW_DROP_NEW:
+                return log_data['log_id']
+            self._events.popleft()
+        self._events.append(log_data)
+        if self._wakeup and len(self._events) >= self.batch_size:
+            self._wakeup.set()
+        return log_data['log_id']
+
+    async def flush(self):
+        while self._events:
+            batch = [self._events.popleft() for _ in range(min(self.batch_size, len(self._events)))]
+            # Пачка уже не в очереди, но ещё не в брокере: при отмене задачи она учитывается в stop
+            self._in_flight = len(batch)
+            try:
+                await asyncio.to_thread(publish_logs, batch)
+            except Exception:
+                self._in_flight = 0
+                logging.exception('Не удалось отправить логи в брокер, отброшено событий: %s', len(batch))
+                LOG_EVENTS_DROPPED.labels(reason="broker").inc(len(batch))
+                return
+            self._in_flight = 0
+
+    async def _run(self):
+        while True:
+            # Пачка уходит, как только набралась, или раз в flush_interval
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+            if self._stopping:
+                return
+
+
+log_queue = AsyncLogQueue()
+
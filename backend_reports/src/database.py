@@ -1,75 +1,612 @@
+import contextlib
+import hashlib
 import json
+import os
+import queue
 import sqlite3
-from typing import Any, Dict, Optional
+import uuid
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+from src.config import DATABASE_URL, DB_POOL_SIZE, DB_POOL_TIMEOUT
+
+
+STATUS_QUEUED = "queued"
+STATUS_RENDERING = "rendering"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+
+def new_token() -> str:
+    """
+    Неугадываемый ключ записи: по нему без авторизации узнают статус задачи
+    и открывают PDF по ленивой ссылке (LAZY_PDF)
+    """
+    return uuid.uuid4().hex
+
+
+# Поля отчёта, вынесенные из data в отдельные колонки: по ним фильтруют и считают агрегаты в БД.
+# fingerprint - хеш всех данных отчёта, по нему находятся повторные отправки той же формы
+REPORT_COLUMNS = (
+    ("region", "TEXT"),
+    ("full_name", "TEXT"),
+    ("authority_name", "TEXT"),
+    ("requests_total", "INTEGER"),
+    ("sessions_total", "INTEGER"),
+    ("sessions_attended", "INTEGER"),
+    ("fingerprint", "TEXT"),
+)
+REPORT_COLUMN_NAMES = tuple(name for name, _ in REPORT_COLUMNS)
+# Колонки в списке отчётов и фильтрах /all: fingerprint - служебный хеш, не поле отчёта
+LISTING_COLUMN_NAMES = tuple(name for name in REPORT_COLUMN_NAMES if name != "fingerprint")
+
+# Категории обращений, которые суммируются в диаграмме отчёта (без обращений к Председателю ЛДПР)
+REQUEST_CATEGORIES = (
+    "utilities", "pensions_and_social_payments", "improvement", "education", "svo",
+    "road_maintenance", "ecology", "medicine_and_healthcare", "public_transport", "illegal_dumps",
+    "legal_aid_requests", "integrated_territory_development", "stray_animal_issues", "legislative_proposals",
+)
+
+
+# Сводка по регионам и месяцам (report_summary), поддерживается при каждом изменении records.
+# В ней только готовые отчёты (STATUS_DONE): вклад прибавляется, когда запись становится готовой
+ALL_REQUEST_CATEGORIES = REQUEST_CATEGORIES + ("appeals_to_ldpr_chairman",)
+SUMMARY_METRICS = ("reports", *ALL_REQUEST_CATEGORIES, "requests_total", "legislation", "svo_projects")
+
+
+def to_int(value) -> int:
+    # Числа в отчёте приходят строками, нечисловые значения считаются нулём, как в диаграмме
+    return int(value) if str(value).isdigit() else 0
+
+
+def canonical_payload(data: Dict[str, Any]) -> bytes:
+    """Данные отчёта в каноническом JSON: не зависит от порядка ключей и форматирования"""
+    return json.dumps(data, ensure_ascii=False, sort_keys=True, separators=(",", ":")).encode()
+
+
+def payload_fingerprint(data: Dict[str, Any]) -> str:
+    """Канонический хеш данных отчёта"""
+    return hashlib.sha256(canonical_payload(data)).hexdigest()
+
+
+def extract_columns(data: Dict[str, Any]) -> Tuple:
+    """Значения REPORT_COLUMNS из данных отчёта, в том же порядке"""
+    general_info = data["general_info"]
+    requests = data["citizen_requests"]["requests"]
+    return (
+        general_info["region"].strip(),
+        general_info["full_name"].strip(),
+        general_info["authority_name"].strip(),
+        sum(to_int(requests.get(category, 0)) for category in REQUEST_CATEGORIES),
+        to_int(general_info["sessions_attended"]["total"]),
+        to_int(general_info["sessions_attended"]["attended"]),
+        payload_fingerprint(data),
+    )
+
+
+def summary_period(created_at) -> str:
+    """Период сводки - месяц создания записи, YYYY-MM"""
+    return str(created_at)[:7]
+
+
+def summary_contribution(data: Dict[str, Any]) -> Tuple[str, Tuple[int, ...]]:
+    """Регион и вклад одного отчёта в метрики SUMMARY_METRICS"""
+    requests = data["citizen_requests"]["requests"]
+    categories = [to_int(requests.get(category, 0)) for category in ALL_REQUEST_CATEGORIES]
+    svo_projects = [
+        project for project in data["svo_support"]["projects"]
+        if (project.get("name") or "").strip() or (project.get("text") or "").strip()
+    ]
+    metrics = (
+        1,
+        *categories,
+        sum(to_int(requests.get(category, 0)) for category in REQUEST_CATEGORIES),
+        len(data["legislation"]),
+        len(svo_projects),
+    )
+    return data["general_info"]["region"].strip(), metrics
+
+
+class SQLitePool:
+    """
+    Пул соединений SQLite, безопасный для потоков.
+
+    WAL позволяет читать параллельно с записью и не блокирует соседние воркеры uvicorn,
+    busy_timeout - ждать освобождения записи вместо мгновенного "database is locked".
+    """
+    placeholder = "?"
+    id_column = "INTEGER PRIMARY KEY AUTOINCREMENT"
+    # Момент "? секунд назад" в формате created_at (CURRENT_TIMESTAMP в SQLite - UTC)
+    seconds_ago = "datetime('now', '-' || ? || ' seconds')"
+    pragmas = (
+        "PRAGMA journal_mode=WAL",
+        "PRAGMA synchronous=NORMAL",
+        "PRAGMA busy_timeout=5000",
+        "PRAGMA foreign_keys=ON",
+        "PRAGMA temp_store=MEMORY",
+        "PRAGMA cache_size=-16000",
+        "PRAGMA mmap_size=134217728",
+    )
+
+    def __init__(self, path: str, size: int, timeout: float):
+        if os.path.isdir(path):
+            # Так бывает, если в docker-compose подключён файл базы, которого нет на хосте
+            raise RuntimeError(f"{path} - каталог, а не файл базы SQLite")
+        self.path = path
+        self.timeout = timeout
+        # Соединения открываются лениво, при первом обращении
+        self._pool = queue.LifoQueue(maxsize=size)
+        for _ in range(size):
+            self._pool.put(None)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        for pragma in self.pragmas:
+            conn.execute(pragma)
+        return conn
+
+    @contextlib.contextmanager
+    def connection(self):
+        """Соединение из пула; commit по выходу из блока, rollback при ошибке"""
+        conn = self._pool.get(timeout=self.timeout)
+        try:
+            if conn is None:
+                conn = self._connect()
+            yield conn
+            conn.commit()
+        except BaseException:
+            if conn is not None:
+                conn.rollback()
+            raise
+        finally:
+            self._pool.put(conn)
+
+    def columns(self, conn, table: str) -> set:
+        return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+    def close(self):
+        while not self._pool.empty():
+            conn = self._pool.get_nowait()
+            if conn is not None:
+                conn.close()
+
+
+class PostgresPool:
+    """Пул соединений PostgreSQL (psycopg_pool); пакет нужен только при DATABASE_URL=postgresql://..."""
+    placeholder = "%s"
+    id_column = "BIGSERIAL PRIMARY KEY"
+    # created_at - TIMESTAMP без зоны в часовом поясе сессии, поэтому и сравнение с LOCALTIMESTAMP
+    seconds_ago = "LOCALTIMESTAMP - ? * INTERVAL '1 second'"
+
+    def __init__(self, url: str, size: int, timeout: float):
+        try:
+            from psycopg_pool import ConnectionPool
+        except ImportError as e:
+            raise RuntimeError("Для PostgreSQL нужен пакет psycopg[binary,pool]") from e
+        self._pool = ConnectionPool(url, min_size=1, max_size=size, timeout=timeout, open=True)
+
+    def connection(self):
+        """Соединение из пула; commit по выходу из блока, rollback при ошибке"""
+        return self._pool.connection()
+
+    def columns(self, conn, table: str) -> set:
+        query = "SELECT column_name FROM information_schema.columns WHERE table_name = %s"
+        return {row[0] for row in conn.execute(query, (table,))}
+
+    def close(self):
+        self._pool.close()
+
+
+def create_pool(url: str, size: int, timeout: float):
+    if url.startswith("sqlite:///"):
+        return SQLitePool(url[len("sqlite:///"):], size, timeout)
+    if url.startswith(("postgresql://", "postgres://")):
+        return PostgresPool(url, size, timeout)
+    raise ValueError(f"Неподдерживаемый DATABASE_URL: {url}")
 
 
 class Database:
-    def __init__(self, db_path: str = "reports_db.sqlite3"):
-        self.conn = sqlite3.connect(db_path)
+    def __init__(self, url: str = DATABASE_URL, pool_size: int = DB_POOL_SIZE, pool_timeout: float = DB_POOL_TIMEOUT):
+        self.pool = create_pool(url, pool_size, pool_timeout)
         self.create_table()
 
+    def _sql(self, query: str) -> str:
+        # Запросы пишутся с плейсхолдерами "?", для PostgreSQL они заменяются на "%s"
+        return query.replace("?", self.pool.placeholder)
+
+    def _execute(self, query: str, params: Sequence = ()) -> int:
+        with self.pool.connection() as conn:
+            return conn.execute(self._sql(query), params).rowcount
+
+    def _fetchone(self, query: str, params: Sequence = ()) -> Optional[Sequence]:
+        with self.pool.connection() as conn:
+            return conn.execute(self._sql(query), params).fetchone()
+
+    def _fetchall(self, query: str, params: Sequence = ()) -> List[Sequence]:
+        with self.pool.connection() as conn:
+            return conn.execute(self._sql(query), params).fetchall()
+
     def create_table(self):
         """Создание таблицы если не существует"""
-        query = """
-        CREATE TABLE IF NOT EXISTS records (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id BIGINT NOT NULL,
-            data TEXT NOT NULL,
-            report_link TEXT, 
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        );
-
-        CREATE INDEX IF NOT EXISTS idx_user_id ON records(user_id);
-        CREATE INDEX IF NOT EXISTS idx_created_at ON records(created_at);
-        """
-        self.conn.executescript(query)
-        self.conn.commit()
-
-    def insert(self, user_id: int, data: Dict[str, Any], report_link: Optional[str] = None) -> int:
-        """Вставка записи с ссылкой"""
-        query = "INSERT INTO records (user_id, data, report_link) VALUES (?, ?, ?)"
-        cursor = self.conn.execute(query, (user_id, json.dumps(data), report_link))
-        self.conn.commit()
-        return cursor.lastrowid
+        queries = [
+            f"""
+            CREATE TABLE IF NOT EXISTS records (
+                id {self.pool.id_column},
+                user_id BIGINT NOT NULL,
+                data TEXT NOT NULL,
+                report_link TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                status TEXT NOT NULL DEFAULT '{STATUS_DONE}',
+                error TEXT,
+                token TEXT,
+                chart_format TEXT
+            )
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_user_id ON records(user_id)",
+            "CREATE INDEX IF NOT EXISTS idx_created_at ON records(created_at)",
+        ]
+        indexes = [
+            "CREATE INDEX IF NOT EXISTS idx_region ON records(region)",
+            "CREATE INDEX IF NOT EXISTS idx_full_name ON records(full_name)",
+            "CREATE INDEX IF NOT EXISTS idx_authority_name ON records(authority_name)",
+            "CREATE INDEX IF NOT EXISTS idx_sessions_attended ON records(sessions_attended)",
+            "CREATE INDEX IF NOT EXISTS idx_user_fingerprint ON records(user_id, fingerprint)",
+            "CREATE UNIQUE INDEX IF NOT EXISTS idx_token ON records(token)",
+        ]
+        metrics = ",\n".join(f"{name} INTEGER NOT NULL DEFAULT 0" for name in SUMMARY_METRICS)
+        summary = f"""
+        CREATE TABLE IF NOT EXISTS report_summary (
+            region TEXT NOT NULL,
+            period TEXT NOT NULL,
+            {metrics},
+            PRIMARY KEY (region, period)
+        )
+        """
+        with self.pool.connection() as conn:
+            for query in queries:
+                conn.execute(query)
+            self.migrate(conn)
+            for query in indexes:
+                conn.execute(query)
+            summary_exists = "region" in self.pool.columns(conn, "report_summary")
+            conn.execute(summary)
+            if not summary_exists:
+                # Сводка появилась в уже работающей базе - считаем её один раз по всем записям
+                self._rebuild_summary(conn)
+
+    def migrate(self, conn):
+        """Добавление колонок, которых нет в таблицах, созданных старыми версиями"""
+        columns = self.pool.columns(conn, "records")
+        if "status" not in columns:
+            conn.execute(f"ALTER TABLE records ADD COLUMN status TEXT NOT NULL DEFAULT '{STATUS_DONE}'")
+        if "error" not in columns:
+            conn.execute("ALTER TABLE records ADD COLUMN error TEXT")
+        if "token" not in columns:
+            conn.execute("ALTER TABLE records ADD COLUMN token TEXT")
+        if "chart_format" not in columns:
+            conn.execute("ALTER TABLE records ADD COLUMN chart_format TEXT")
+        rows = conn.execute("SELECT id FROM records WHERE token IS NULL").fetchall()
+        if rows:
+            conn.cursor().executemany(
+                self._sql("UPDATE records SET token = ? WHERE id = ?"),
+                [(new_token(), row[0]) for row in rows]
+            )
+        # Ленивые ссылки вида .../media/records/<id>.pdf заменяются ссылками по token
+        rows = conn.execute(
+            "SELECT id, report_link, token FROM records WHERE report_link LIKE '%/media/records/%'"
+        ).fetchall()
+        updates = [
+            (f"{report_link.rsplit('/', 1)[0]}/{token}.pdf", record_id)
+            for record_id, report_link, token in rows
+            if report_link.rsplit("/", 1)[-1] == f"{record_id}.pdf"
+        ]
+        if updates:
+            conn.cursor().executemany(self._sql("UPDATE records SET report_link = ? WHERE id = ?"), updates)
+        for name, column_type in REPORT_COLUMNS:
+            if name not in columns:
+                conn.execute(f"ALTER TABLE records ADD COLUMN {name} {column_type}")
+
+        # Заполнение вынесенных колонок у записей, сохранённых до их появления
+        missing = " OR ".join(f"{name} IS NULL" for name in REPORT_COLUMN_NAMES)
+        rows = conn.execute(f"SELECT id, data FROM records WHERE {missing}").fetchall()
+        if rows:
+            assignments = ", ".join(f"{name} = ?" for name in REPORT_COLUMN_NAMES)
+            conn.cursor().executemany(
+                self._sql(f"UPDATE records SET {assignments} WHERE id = ?"),
+                [(*extract_columns(json.loads(data)), record_id) for record_id, data in rows]
+            )
+
+    def close(self):
+        self.pool.close()
+
+    def _apply_summary(self, conn, data: Dict[str, Any], created_at, sign: int):
+        """Прибавить (sign=1) или вычесть (sign=-1) вклад отчёта в строку сводки его региона и месяца"""
+        region, metrics = summary_contribution(data)
+        names = ", ".join(SUMMARY_METRICS)
+        placeholders = ", ".join("?" for _ in SUMMARY_METRICS)
+        increments = ", ".join(f"{name} = report_summary.{name} + excluded.{name}" for name in SUMMARY_METRICS)
+        query = f"""
+        INSERT INTO report_summary (region, period, {names}) VALUES (?, ?, {placeholders})
+        ON CONFLICT (region, period) DO UPDATE SET {increments}
+        """
+        period = summary_period(created_at)
+        conn.execute(self._sql(query), (region, period, *(sign * value for value in metrics)))
+        if sign < 0:
+            # Строка без отчётов не нужна: сводка совпадает с пересчитанной с нуля
+            conn.execute(
+                self._sql("DELETE FROM report_summary WHERE region = ? AND period = ? AND reports <= 0"),
+                (region, period)
+            )
+
+    def _rebuild_summary(self, conn):
+        conn.execute("DELETE FROM report_summary")
+        rows = conn.execute(self._sql("SELECT data, created_at FROM records WHERE status = ?"), (STATUS_DONE,))
+        for data, created_at in rows.fetchall():
+            self._apply_summary(conn, json.loads(data), created_at, 1)
+
+    def rebuild_summary(self):
+        """Пересчёт сводки с нуля (например, после ручных правок records)"""
+        with self.pool.connection() as conn:
+            self._rebuild_summary(conn)
+
+    def get_summary(
+            self,
+            group_by: Sequence[str],
+            region: Optional[str] = None,
+            period_from: Optional[str] = None,
+            period_to: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Агрегаты по сводке report_summary.
+
+        group_by - колонки группировки из ("region", "period"), пустой список - итог по всем строкам.
+        Период задаётся месяцами YYYY-MM, границы включительно.
+        """
+        if not set(group_by) <= {"region", "period"}:
+            raise ValueError(f"Группировка по {group_by} не поддерживается")
+        conditions, params = [], []
+        if region is not None:
+            conditions.append("region = ?")
+            params.append(region)
+        if period_from is not None:
+            conditions.append("period >= ?")
+            params.append(period_from)
+        if period_to is not None:
+            conditions.append("period <= ?")
+            params.append(period_to)
+
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        group_columns = ", ".join(group_by)
+        sums = ", ".join(f"SUM({name})" for name in SUMMARY_METRICS)
+        query = f"""
+        SELECT {group_columns + ", " if group_by else ""}{sums} FROM report_summary
+        {where}
+        {f"GROUP BY {group_columns} ORDER BY {group_columns}" if group_by else ""}
+        """
+        return [
+            {
+                **dict(zip(group_by, row[:len(group_by)])),
+                **{name: int(value or 0) for name, value in zip(SUMMARY_METRICS, row[len(group_by):])}
+            }
+            for row in self._fetchall(query, params)
+        ]
+
+    def insert(
+            self,
+            user_id: int,
+            data: Dict[str, Any],
+            report_link: Optional[str] = None,
+            status: str = STATUS_DONE,
+            chart_format: Optional[str] = None
+    ) -> Tuple[int, str]:
+        """
+        Вставка записи с ссылкой; возвращает ID записи и её token.
+        chart_format - формат диаграммы из запроса (None - по умолчанию), по нему PDF генерируется позже (LAZY_PDF)
+        """
+        columns = ", ".join(REPORT_COLUMN_NAMES)
+        placeholders = ", ".join("?" for _ in REPORT_COLUMN_NAMES)
+        query = f"""
+        INSERT INTO records (user_id, data, report_link, status, token, chart_format, {columns})
+        VALUES (?, ?, ?, ?, ?, ?, {placeholders}) RETURNING id, created_at
+        """
+        token = new_token()
+        params = (user_id, json.dumps(data), report_link, status, token, chart_format, *extract_columns(data))
+        with self.pool.connection() as conn:
+            record_id, created_at = conn.execute(self._sql(query), params).fetchone()
+            if status == STATUS_DONE:
+                self._apply_summary(conn, data, created_at, 1)
+        return record_id, token
+
+    def find_duplicate(self, user_id: int, data: Dict[str, Any], window_seconds: int) -> Optional[Dict[str, Any]]:
+        """
+        Последняя неупавшая запись пользователя с теми же данными отчёта, созданная не раньше
+        window_seconds назад; None, если такой нет.
+        """
+        # Окно считается в самой БД: у created_at нет часового пояса, время Python с ним не сравнить
+        query = f"""
+        SELECT id, status, report_link, error, token FROM records
+        WHERE user_id = ? AND fingerprint = ? AND created_at >= {self.pool.seconds_ago} AND status != ?
+        ORDER BY id DESC LIMIT 1
+        """
+        row = self._fetchone(query, (user_id, payload_fingerprint(data), window_seconds, STATUS_FAILED))
+        if row:
+            return {"id": row[0], "status": row[1], "report_link": row[2], "error": row[3], "token": row[4]}
+        return None
+
+    def set_status(
+            self,
+            record_id: int,
+            status: str,
+            report_link: Optional[str] = None,
+            error: Optional[str] = None
+    ):
+        """Обновление статуса задачи генерации отчёта; в сводку отчёт попадает, когда становится готовым"""
+        query = "UPDATE records SET status = ?, report_link = COALESCE(?, report_link), error = ? WHERE id = ?"
+        with self.pool.connection() as conn:
+            old = conn.execute(
+                self._sql("SELECT status, data, created_at FROM records WHERE id = ?"), (record_id,)
+            ).fetchone()
+            conn.execute(self._sql(query), (status, report_link, error, record_id))
+            if old and (old[0] == STATUS_DONE) != (status == STATUS_DONE):
+                self._apply_summary(conn, json.loads(old[1]), old[2], 1 if status == STATUS_DONE else -1)
+
+    def get_status(self, token: str) -> Optional[Dict[str, Any]]:
+        """Статус задачи генерации отчёта по token записи, без колонки data"""
+        query = "SELECT token, status, report_link, error FROM records WHERE token = ?"
+        row = self._fetchone(query, (token,))
+        if row:
+            return {"job_id": row[0], "status": row[1], "report_link": row[2], "error": row[3]}
+        return None
+
+    def fail_unfinished(self, error: str, older_than_seconds: float) -> int:
+        """
+        Пометить неудачными задачи, прерванные перезапуском сервиса: незавершённые и созданные
+        больше older_than_seconds назад. Более свежие могут выполняться соседним воркером
+        """
+        query = f"UPDATE records SET status = ?, error = ? WHERE status IN (?, ?) AND created_at < {self.pool.seconds_ago}"
+        return self._execute(query, (STATUS_FAILED, error, STATUS_QUEUED, STATUS_RENDERING, older_than_seconds))
 
     def update_link(self, record_id: int, report_link: str):
         """Метод для обновления ссылки (понадобится для скрипта восстановления)"""
         query = "UPDATE records SET report_link = ? WHERE id = ?"
-        self.conn.execute(query, (report_link, record_id))
-        self.conn.commit()
+        self._execute(query, (report_link, record_id))
 
-    def get_all(self) -> list:
-        """Получить все записи без колонки data"""
-        query = "SELECT id, user_id, report_link, created_at FROM records ORDER BY id DESC"
-        cursor = self.conn.execute(query)
-        return [
-            {"id": row[0], "user_id": row[1], "report_link": row[2], "created_at": row[3]}
-            for row in cursor.fetchall()
+    def linked_filenames(self) -> Set[str]:
+        """Имена файлов из всех ссылок на отчёты (для очистки осиротевших PDF)"""
+        rows = self._fetchall("SELECT report_link FROM records WHERE report_link IS NOT NULL")
+        return {row[0].rsplit("/", 1)[-1] for row in rows}
+
+    def find_ids(
+            self,
+            missing_only: bool = True,
+            ids: Optional[Sequence[int]] = None,
+            date_from: Optional[date] = None,
+            date_to: Optional[date] = None
+    ) -> List[int]:
+        """ID записей для перегенерации отчётов (скрипт восстановления), по возрастанию"""
+        # Задачи в очереди и в генерации не трогаем: их PDF доделает сервис
+        conditions, params = ["status NOT IN (?, ?)"], [STATUS_QUEUED, STATUS_RENDERING]
+        if missing_only:
+            # Ссылки нет и у упавших задач; по умолчанию восстанавливаются только готовые отчёты без PDF
+            conditions.append("status = ? AND report_link IS NULL")
+            params.append(STATUS_DONE)
+        if ids:
+            conditions.append(f"id IN ({', '.join('?' for _ in ids)})")
+            params.extend(ids)
+        if date_from is not None:
+            conditions.append("created_at >= ?")
+            params.append(date_from.isoformat())
+        if date_to is not None:
+            conditions.append("created_at < ?")
+            params.append((date_to + timedelta(days=1)).isoformat())
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        return [row[0] for row in self._fetchall(f"SELECT id FROM records {where} ORDER BY id", params)]
+
+    def get_page(
+            self,
+            limit: int,
+            after: Optional[Tuple[str, int]] = None,
+            user_id: Optional[int] = None,
+            date_from: Optional[date] = None,
+            date_to: Optional[date] = None,
+            filters: Optional[Dict[str, Any]] = None
+    ) -> Tuple[list, Optional[Tuple[str, int]]]:
+        """
+        Страница записей без колонки data, от новых к старым.
+
+        Пагинация по ключу (created_at, id): следующая страница начинается строго после
+        последней записи предыдущей, поэтому время запроса не растёт с номером страницы.
+        filters - точные значения колонок из LISTING_COLUMN_NAMES (region, sessions_attended, ...).
+        Возвращает записи и ключ для следующей страницы (None, если страница последняя).
+        """
+        conditions, params = [], []
+        if user_id is not None:
+            conditions.append("user_id = ?")
+            params.append(user_id)
+        for name, value in (filters or {}).items():
+            if name not in LISTING_COLUMN_NAMES:
+                raise ValueError(f"Фильтр по колонке {name} не поддерживается")
+            if value is not None:
+                conditions.append(f"{name} = ?")
+                params.append(value)
+        if date_from is not None:
+            conditions.append("created_at >= ?")
+            params.append(date_from.isoformat())
+        if date_to is not None:
+            conditions.append("created_at < ?")
+            params.append((date_to + timedelta(days=1)).isoformat())
+        if after is not None:
+            conditions.append("(created_at, id) < (?, ?)")
+            params.extend(after)
+
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        query = f"""
+        SELECT id, user_id, report_link, created_at, status, {", ".join(LISTING_COLUMN_NAMES)} FROM records
+        {where}
+        ORDER BY created_at DESC, id DESC
+        LIMIT ?
+        """
+        rows = self._fetchall(query, (*params, limit + 1))
+
+        items = [
+            {
+                "id": row[0], "user_id": row[1], "report_link": row[2], "created_at": row[3], "status": row[4],
+                **dict(zip(LISTING_COLUMN_NAMES, row[5:]))
+            }
+            for row in rows[:limit]
         ]
+        next_after = None
+        if len(rows) > limit:
+            last = rows[limit - 1]
+            next_after = (str(last[3]), last[0])
+        return items, next_after
 
     def get_by_id(self, record_id: int) -> Optional[Dict[str, Any]]:
         """Получить детальную запись по ID"""
-        query = "SELECT id, user_id, data, report_link, created_at FROM records WHERE id = ?"
-        cursor = self.conn.execute(query, (record_id,))
-        row = cursor.fetchone()
+        query = "SELECT id, user_id, data, report_link, created_at, status, token FROM records WHERE id = ?"
+        row = self._fetchone(query, (record_id,))
         if row:
             return {
-                "id": row[0], 
-                "user_id": row[1], 
-                "data": json.loads(row[2]), 
-                "report_link": row[3], 
-                "created_at": row[4]
+                "id": row[0],
+                "user_id": row[1],
+                "data": json.loads(row[2]),
+                "report_link": row[3],
+                "created_at": row[4],
+                "status": row[5],
+                "token": row[6]
             }
         return None
 
-    def update(self, record_id: int, data: Dict[str, Any], report_link: str):
-        """Обновить data и ссылку для записи"""
-        query = "UPDATE records SET data = ?, report_link = ? WHERE id = ?"
-        self.conn.execute(query, (json.dumps(data), report_link, record_id))
-        self.conn.commit()
+    def find_by_token(self, token: str) -> Optional[Dict[str, Any]]:
+        """ID, статус, отпечаток данных и формат диаграммы записи по её token, без чтения колонки data"""
+        query = "SELECT id, status, fingerprint, chart_format FROM records WHERE token = ?"
+        row = self._fetchone(query, (token,))
+        if row:
+            return {"id": row[0], "status": row[1], "fingerprint": row[2], "chart_format": row[3]}
+        return None
+
+    def update(self, record_id: int, data: Dict[str, Any], report_link: str, chart_format: Optional[str] = None):
+        """Обновить data, ссылку и формат диаграммы; запись со ссылкой считается готовой (в т.ч. бывшая неудачная)"""
+        assignments = ", ".join(f"{name} = ?" for name in REPORT_COLUMN_NAMES)
+        query = (
+            "UPDATE records SET data = ?, report_link = ?, status = ?, error = NULL, chart_format = ?, "
+            f"{assignments} WHERE id = ? RETURNING created_at"
+        )
+        with self.pool.connection() as conn:
+            old = conn.execute(self._sql("SELECT data, status FROM records WHERE id = ?"), (record_id,)).fetchone()
+            row = conn.execute(
+                self._sql(query),
+                (json.dumps(data), report_link, STATUS_DONE, chart_format, *extract_columns(data), record_id)
+            ).fetchone()
+            if old and row:
+                if old[1] == STATUS_DONE:
+                    self._apply_summary(conn, json.loads(old[0]), row[0], -1)
+                self._apply_summary(conn, data, row[0], 1)
 
     def delete(self, record_id: int):
         """Удалить запись по ID"""
-        query = "DELETE FROM records WHERE id = ?"
-        self.conn.execute(query, (record_id,))
-        self.conn.commit()
+        query = "DELETE FROM records WHERE id = ? RETURNING data, created_at, status"
+        with self.pool.connection() as conn:
+            row = conn.execute(self._sql(query), (record_id,)).fetchone()
+            if row and row[2] == STATUS_DONE:
+                self._apply_summary(conn, json.loads(row[0]), row[1], -1)
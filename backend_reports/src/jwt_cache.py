@@ -0,0 +1,52 @@
+"""
+Кеш проверенных JWT.
+
+Проверка подписи RS256 - самая дорогая часть авторизации, а клиент присылает один и тот же
+токен много раз подряд. Кеш хранит claims по sha256 токена до его exp, но не дольше ttl,
+так что повторный запрос с тем же токеном обходится без криптографии. Невалидные токены
+не кешируются. Тот же модуль есть в backend_federal_plan (src/infrastructure/jwt_cache.py).
+"""
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Tuple
+
+
+class VerifiedTokenCache:
+    """LRU на max_size токенов; decode передаётся при вызове, поэтому кеш не зависит от JWT-библиотеки"""
+
+    def __init__(self, max_size: int = 1024, ttl: float = 300):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[bytes, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+
+    def verify(self, token: str, decode: Callable[[str], Dict[str, Any]]) -> Dict[str, Any]:
+        """claims токена из кеша или от decode (проверка подписи); ошибки decode пробрасываются как есть"""
+        key = hashlib.sha256(token.encode()).digest()
+        now = time.time()
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, claims = entry
+            if expires_at > now:
+                self._entries.move_to_end(key)
+                return claims
+            del self._entries[key]
+
+        claims = decode(token)
+        expires_at = now + self.ttl
+        try:
+            expires_at = min(expires_at, float(claims["exp"]))
+        except KeyError:
+            pass
+        except (TypeError, ValueError):
+            # exp не число - проверку оставляем вызывающему, в кеш не кладём
+            return claims
+
+        if expires_at > now and self.max_size > 0:
+            self._entries[key] = (expires_at, claims)
+            if len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return claims
+
+    def clear(self):
+        self._entries.clear()
@@ -1,22 +1,38 @@
+import asyncio
+import base64
+import json
 import os
 import uuid
+from datetime import date
+from pathlib import Path
+from typing import Literal, Optional, Tuple
 
-from fastapi import FastAPI, Request, APIRouter, Depends, HTTPException
-from fastapi.staticfiles import StaticFiles
+from fastapi import FastAPI, Request, Response, APIRouter, Depends, HTTPException, Query
+from fastapi.responses import FileResponse
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 from fastapi.middleware.cors import CORSMiddleware
 
 from src.auth import get_current_admin, User
-from src.celery_app import CeleryTaskClient
-from src.pdf_creater import generate_pdf_report
+from src.config import CHART_FORMAT, DEDUP_WINDOW, LAZY_PDF, PDF_CACHE_DIR, PDF_CACHE_MAX_BYTES, SWEEP_INTERVAL, MEDIA_ACCEL_PREFIX
+from src.config import PROFILE_REQUESTS, PROFILE_DIR, NOTIFY_CHAT_IDS, STALE_JOB_AGE
+from src.celery_app import log_queue, report_reference
+from src.media import MediaFiles, REVALIDATE_CACHE_CONTROL, content_etag, media_response
+from src.pdf_cache import PdfCache
+from src.profiling import PROFILE_HEADER
+from src.renderer import ReportRenderer, RenderQueueFull, RenderTimeout
+from src.sweeper import MediaSweeper
 from src import database
-from src.model import InputData
+from src.model import InputData, ChartFormat, Delivery
 
 
 app = FastAPI()
 router = APIRouter(prefix='/api/reports')
-app.mount("/api/reports/media", StaticFiles(directory="media"), name="media")
 db = database.Database()
-db.create_table()
+renderer = ReportRenderer()
+report_jobs = set()
+pdf_cache = PdfCache(PDF_CACHE_DIR, PDF_CACHE_MAX_BYTES)
+render_locks = {}
+background_tasks = set()
 
 app.add_middleware(
     CORSMiddleware,
@@ -28,51 +44,397 @@ app.add_middleware(
 )
 
 
+@app.on_event("startup")
+async def startup_event():
+    db.fail_unfinished("Генерация прервана перезапуском сервиса", STALE_JOB_AGE)
+    renderer.start()
+    log_queue.start()
+    if SWEEP_INTERVAL > 0:
+        background_tasks.add(asyncio.create_task(MediaSweeper(db).run(SWEEP_INTERVAL)))
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    for task in background_tasks:
+        task.cancel()
+    renderer.shutdown()
+    await log_queue.stop()
+    db.close()
+
+
+async def render_report(
+        data: dict,
+        report_filepath: Optional[str],
+        chart_format: Optional[str] = None,
+        profile_path: Optional[str] = None
+) -> Optional[bytes]:
+    """Генерация в report_filepath; без него PDF генерируется в память и возвращается байтами"""
+    try:
+        if report_filepath is None:
+            return await renderer.render_bytes(data, chart_format or CHART_FORMAT, profile_path)
+        await renderer.render(data, report_filepath, chart_format or CHART_FORMAT, profile_path)
+    except RenderQueueFull:
+        raise HTTPException(
+            status_code=503,
+            detail="Сервис перегружен, повторите попытку позже",
+            headers={"Retry-After": "10"}
+        )
+    except RenderTimeout:
+        raise HTTPException(status_code=504, detail="Превышено время генерации отчёта")
+
+
+def lazy_report_link(base_url: str, token: str) -> str:
+    # В ссылке token записи, а не её ID: ссылки на чужие отчёты нельзя подобрать перебором
+    return f"{base_url.rstrip('/')}/api/reports/media/records/{token}.pdf".replace('http://', 'https://')
+
+
+def pdf_response(pdf: bytes, filename: str, response: Response) -> Response:
+    """PDF в теле ответа (delivery=inline); заголовки, выставленные обработчику, сохраняются"""
+    headers = {**response.headers, "Content-Disposition": f'inline; filename="{filename}"'}
+    return Response(pdf, media_type="application/pdf", headers=headers)
+
+
+async def store_report_pdf(record_id: int, token: str, data: dict, pdf: bytes, base_url: str) -> str:
+    """Сохранение PDF, уже отданного клиенту inline, для истории отчётов; возвращает ссылку"""
+    if LAZY_PDF:
+        path = pdf_cache.path(record_id, database.payload_fingerprint(data))
+        with pdf_cache.write(path) as tmp_path:
+            await asyncio.to_thread(Path(tmp_path).write_bytes, pdf)
+        await asyncio.to_thread(pdf_cache.maybe_evict, path)
+        return lazy_report_link(base_url, token)
+
+    report_filename = f"report_{uuid.uuid4()}.pdf"
+    await asyncio.to_thread(Path("media", report_filename).write_bytes, pdf)
+    return f"{base_url}/api/reports/media/{report_filename}".replace('http://', 'https://')
+
+
+async def stored_report_response(record: dict, request: Request) -> Optional[Response]:
+    """Готовый PDF записи для delivery=inline; None, если файла нет"""
+    if record["status"] != database.STATUS_DONE or not record.get("report_link"):
+        return None
+    if "/media/records/" in record["report_link"]:
+        file_response = await get_report_pdf(record["token"], request)
+    else:
+        path = os.path.join("media", record["report_link"].split("/")[-1])
+        if not os.path.exists(path):
+            return None
+        file_response = FileResponse(path, media_type="application/pdf")
+    file_response.headers["Content-Disposition"] = f'inline; filename="report_{record["id"]}.pdf"'
+    return file_response
+
+
+def requested_profile_path(request: Request, response: Response) -> Optional[str]:
+    """
+    Путь для статистики cProfile, если клиент прислал X-Profile: 1 и профилирование включено.
+
+    Имя файла возвращается в заголовке X-Profile-File; смотреть, например, snakeviz или pstats.
+    """
+    if not PROFILE_REQUESTS or request.headers.get(PROFILE_HEADER) != "1":
+        return None
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    profile_filename = f"report_{uuid.uuid4().hex}.pstats"
+    response.headers["X-Profile-File"] = profile_filename
+    return os.path.join(PROFILE_DIR, profile_filename)
+
+
 @router.get("/ping")
 async def ping():
     return {"message": "Pong"}
 
 
+@router.get("/metrics")
+async def metrics():
+    """Метрики Prometheus, в том числе длительность этапов генерации PDF"""
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
 @router.post("/without_logs")
-async def create_pdf(input_data: InputData, request: Request):
-    report_filename = f"report_{uuid.uuid4()}.pdf"
+async def create_pdf(
+        input_data: InputData,
+        request: Request,
+        response: Response,
+        chart_format: Optional[ChartFormat] = None,
+        delivery: Delivery = "link"
+):
+    """Отчёт без сохранения в БД; delivery=inline - PDF в теле ответа, без файла в media/"""
+    profile_path = requested_profile_path(request, response)
+    if delivery == "inline":
+        pdf = await render_report(input_data.data.dict(), None, chart_format, profile_path)
+        return pdf_response(pdf, "report.pdf", response)
+
+    # Не report_: такие файлы без записи в БД удаляет MediaSweeper
+    report_filename = f"draft_{uuid.uuid4()}.pdf"
     report_filepath = os.path.join("media", report_filename)
-    generate_pdf_report(input_data.data.dict(), report_filepath)
+    await render_report(input_data.data.dict(), report_filepath, chart_format, profile_path)
     link = f"{request.base_url}/api/reports/media/{report_filename}".replace('http://', 'https://')
     return {"status": "Success", "message": link}
 
 
-@router.post("/")
-async def create_pdf(input_data: InputData, request: Request):
+@router.post("/", status_code=202)
+async def create_pdf(
+        input_data: InputData,
+        request: Request,
+        response: Response,
+        notify_chat_id: Optional[int] = None,
+        chart_format: Optional[ChartFormat] = None,
+        delivery: Delivery = "link"
+):
+    """
+    Приём отчёта: запись сохраняется со статусом queued, PDF генерируется в фоне.
+
+    С delivery=inline PDF генерируется сразу в память и возвращается в теле ответа
+    (ID задачи - в заголовке X-Job-Id), а для истории сохраняется на диск уже после генерации.
+    ID задачи - случайный token записи, а не её порядковый ID: статус задачи и ссылку
+    на отчёт без авторизации может узнать только тот, кто его отправил.
+    Повторная отправка тех же данных тем же пользователем в течение DEDUP_WINDOW
+    возвращает уже существующую задачу (или её готовый PDF) без новой записи и генерации.
+    notify_chat_id принимается только из списка NOTIFY_CHAT_IDS.
+    """
+    if notify_chat_id is not None and notify_chat_id not in NOTIFY_CHAT_IDS:
+        raise HTTPException(status_code=403, detail="Уведомление в этот чат не разрешено")
+
+    if DEDUP_WINDOW > 0:
+        duplicate = await asyncio.to_thread(db.find_duplicate, input_data.user_id, input_data.data.dict(), DEDUP_WINDOW)
+        if duplicate:
+            if delivery == "inline":
+                stored = await stored_report_response(duplicate, request)
+                if stored:
+                    stored.headers["X-Job-Id"] = duplicate["token"]
+                    return stored
+            return {"status": "Accepted", "job_id": duplicate["token"], "duplicate": True}
+
+    if renderer.is_full():
+        raise HTTPException(
+            status_code=503,
+            detail="Сервис перегружен, повторите попытку позже",
+            headers={"Retry-After": "10"}
+        )
+    if delivery == "inline":
+        return await create_report_inline(
+            input_data, request, response, notify_chat_id, chart_format or CHART_FORMAT
+        )
+
+    record_id, token = await asyncio.to_thread(
+        db.insert, input_data.user_id, input_data.data.dict(), status=database.STATUS_QUEUED, chart_format=chart_format
+    )
+    task = asyncio.create_task(
+        process_report_job(
+            record_id,
+            token,
+            input_data,
+            str(request.base_url),
+            notify_chat_id,
+            chart_format or CHART_FORMAT,
+            requested_profile_path(request, response)
+        )
+    )
+    report_jobs.add(task)
+    task.add_done_callback(report_jobs.discard)
+    return {"status": "Accepted", "job_id": token}
+
+
+async def create_report_inline(
+        input_data: InputData,
+        request: Request,
+        response: Response,
+        notify_chat_id: Optional[int],
+        chart_format: str
+) -> Response:
+    data = input_data.data.dict()
+    record_id, token = await asyncio.to_thread(
+        db.insert, input_data.user_id, data, status=database.STATUS_RENDERING, chart_format=chart_format
+    )
     try:
-        report_filename = f"report_{uuid.uuid4()}.pdf"
-        report_filepath = os.path.join("media", report_filename)
-        generate_pdf_report(input_data.data.dict(), report_filepath)
-        link = f"{request.base_url}/api/reports/media/{report_filename}".replace('http://', 'https://')
-        db.insert(input_data.user_id, input_data.data.dict(), link)
-        CeleryTaskClient.send_log(
-            message=f"Новый отчёт у {input_data.data.general_info.full_name}\nСсылка на отчёт: {link}",
-            level='INFO', extra_data={**input_data.data.dict(), "link": link})
-        return {"status": "Success", "message": link}
+        pdf = await render_report(data, None, chart_format, requested_profile_path(request, response))
     except Exception as e:
-        CeleryTaskClient.send_log(
-            message=f"Ошибка при создании отчёта у {input_data.data.general_info.full_name}",
-            level='ERROR',
-            extra_data={**input_data.data.dict(), "error": e.__dict__}
-        )
+        await report_failed(record_id, input_data, e)
         raise
 
+    link = await store_report_pdf(record_id, token, data, pdf, str(request.base_url))
+    await asyncio.to_thread(db.set_status, record_id, database.STATUS_DONE, report_link=link)
+    notify_report_ready(record_id, input_data, link, notify_chat_id)
+    response.headers["X-Job-Id"] = token
+    return pdf_response(pdf, f"report_{record_id}.pdf", response)
+
+
+async def process_report_job(
+        record_id: int,
+        token: str,
+        input_data: InputData,
+        base_url: str,
+        notify_chat_id: Optional[int],
+        chart_format: str,
+        profile_path: Optional[str] = None
+):
+    if LAZY_PDF:
+        # PDF будет создан при первом открытии ссылки, в формате диаграммы, сохранённом с записью
+        link = lazy_report_link(base_url, token)
+        await asyncio.to_thread(db.set_status, record_id, database.STATUS_DONE, report_link=link)
+        notify_report_ready(record_id, input_data, link, notify_chat_id)
+        return
+
+    report_filename = f"report_{uuid.uuid4()}.pdf"
+    report_filepath = os.path.join("media", report_filename)
+    try:
+        await asyncio.to_thread(db.set_status, record_id, database.STATUS_RENDERING)
+        # Задача уже принята, поэтому при переполненной очереди она ждёт, а не падает
+        await renderer.render(input_data.data.dict(), report_filepath, chart_format, profile_path, wait=True)
+    except Exception as e:
+        await report_failed(record_id, input_data, e)
+        return
+
+    link = f"{base_url}/api/reports/media/{report_filename}".replace('http://', 'https://')
+    await asyncio.to_thread(db.set_status, record_id, database.STATUS_DONE, report_link=link)
+    notify_report_ready(record_id, input_data, link, notify_chat_id)
+
+
+async def report_failed(record_id: int, input_data: InputData, e: Exception):
+    error = e.detail if isinstance(e, HTTPException) else str(e)
+    await asyncio.to_thread(db.set_status, record_id, database.STATUS_FAILED, error=error or type(e).__name__)
+    log_queue.put(
+        message=f"Ошибка при создании отчёта у {input_data.data.general_info.full_name}",
+        level='ERROR',
+        extra_data=report_reference(
+            record_id, input_data.user_id, input_data.data.dict(), error=error or type(e).__name__
+        )
+    )
+
+
+def notify_report_ready(record_id: int, input_data: InputData, link: str, notify_chat_id: Optional[int]):
+    log_queue.put(
+        message=f"Новый отчёт у {input_data.data.general_info.full_name}\nСсылка на отчёт: {link}",
+        level='INFO', extra_data=report_reference(record_id, input_data.user_id, input_data.data.dict(), link=link))
+    if notify_chat_id:
+        log_queue.put(
+            message=f"Отчёт готов\nСсылка на отчёт: {link}",
+            level='INFO', log_id=str(record_id), custom_chat_id=notify_chat_id)
+
+
+@router.get("/media/records/{token}.pdf")
+async def get_report_pdf(token: str, request: Request):
+    """
+    PDF отчёта с генерацией при первом обращении (режим LAZY_PDF).
+
+    Отчёт ищется по token записи; генерируются только готовые (status done) отчёты,
+    с форматом диаграммы из запроса, с которым отчёт был создан или обновлён.
+    Файл кешируется под версией шаблона и отпечатком данных: после изменения pdf_creater,
+    стилей или самого отчёта он будет сгенерирован заново.
+    """
+    source = await asyncio.to_thread(db.find_by_token, token)
+    if source is None or source["status"] != database.STATUS_DONE:
+        raise HTTPException(status_code=404, detail="Отчет не найден")
+
+    record_id = source["id"]
+    path = pdf_cache.path(record_id, source["fingerprint"])
+    if not pdf_cache.get(path):
+        # Одновременные первые обращения к одному отчёту ждут одну генерацию
+        lock = render_locks.setdefault(path, asyncio.Lock())
+        async with lock:
+            try:
+                if not pdf_cache.get(path):
+                    record = await asyncio.to_thread(db.get_by_id, record_id)
+                    if not record:
+                        raise HTTPException(status_code=404, detail="Отчет не найден")
+                    with pdf_cache.write(path) as tmp_path:
+                        await render_report(record["data"], tmp_path, source["chart_format"])
+                    # Сканирование и удаление файлов кеша - в потоке, чтобы не блокировать event loop
+                    await asyncio.to_thread(pdf_cache.maybe_evict, path)
+            finally:
+                render_locks.pop(path, None)
+
+    # По этой ссылке после изменения отчёта отдаётся другой файл, поэтому не immutable, а сверка ETag
+    accel_path = f"{MEDIA_ACCEL_PREFIX}{os.path.relpath(path, 'media')}" if MEDIA_ACCEL_PREFIX else None
+    stat_result = os.stat(path)
+    if not accel_path:
+        # Хеш для ETag считается в потоке, media_response возьмёт его из кеша
+        await asyncio.to_thread(content_etag, path, stat_result)
+    return media_response(
+        path, stat_result, request.headers, cache_control=REVALIDATE_CACHE_CONTROL, accel_path=accel_path
+    )
+
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Статус задачи генерации отчёта: queued / rendering / done / failed"""
+    job = await asyncio.to_thread(db.get_status, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Задача не найдена")
+    return job
+
+
+def encode_cursor(after: Tuple[str, int]) -> str:
+    return base64.urlsafe_b64encode(json.dumps(after).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[str, int]:
+    try:
+        created_at, record_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return str(created_at), int(record_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Некорректный курсор")
+
 
 @router.get("/all")
-async def get_all_reports(admin: User = Depends(get_current_admin)):
-    """1. Получение списка всех отчётов (без поля data)"""
-    return db.get_all()
+async def get_all_reports(
+        limit: int = Query(50, ge=1, le=500),
+        cursor: Optional[str] = None,
+        user_id: Optional[int] = None,
+        date_from: Optional[date] = None,
+        date_to: Optional[date] = None,
+        region: Optional[str] = None,
+        full_name: Optional[str] = None,
+        authority_name: Optional[str] = None,
+        sessions_attended: Optional[int] = None,
+        admin: User = Depends(get_current_admin)
+):
+    """
+    1. Получение списка отчётов (без поля data), от новых к старым, постранично.
+
+    Следующая страница запрашивается с cursor=next_cursor; next_cursor = null на последней странице.
+    Фильтры: user_id, диапазон дат создания date_from..date_to включительно
+    и точные значения region, full_name, authority_name, sessions_attended.
+    """
+    after = decode_cursor(cursor) if cursor else None
+    filters = {
+        "region": region,
+        "full_name": full_name,
+        "authority_name": authority_name,
+        "sessions_attended": sessions_attended,
+    }
+    items, next_after = await asyncio.to_thread(
+        db.get_page, limit, after, user_id=user_id, date_from=date_from, date_to=date_to, filters=filters
+    )
+    return {"items": items, "next_cursor": encode_cursor(next_after) if next_after else None}
+
+
+@router.get("/analytics")
+async def get_analytics(
+        group_by: Literal["region", "period", "region_period", "total"] = "region_period",
+        region: Optional[str] = None,
+        period_from: Optional[str] = Query(None, pattern=r"^\d{4}-\d{2}$"),
+        period_to: Optional[str] = Query(None, pattern=r"^\d{4}-\d{2}$"),
+        admin: User = Depends(get_current_admin)
+):
+    """
+    Сводка по отчётам: число отчётов, обращения по категориям, законопроекты и проекты СВО.
+
+    Считается SQL-агрегатами по таблице report_summary, которая обновляется при каждом
+    сохранении, изменении и удалении отчёта. Учитываются только готовые отчёты (status done):
+    задачи в очереди и упавшие не считаются. Периоды - месяцы YYYY-MM, границы включительно.
+    """
+    columns = {
+        "region": ["region"],
+        "period": ["period"],
+        "region_period": ["region", "period"],
+        "total": [],
+    }[group_by]
+    return await asyncio.to_thread(db.get_summary, columns, region=region, period_from=period_from, period_to=period_to)
 
 
 @router.get("/{record_id}")
 async def get_report(record_id: int, admin: User = Depends(get_current_admin)):
     """2. Получение детального record по id"""
-    record = db.get_by_id(record_id)
+    record = await asyncio.to_thread(db.get_by_id, record_id)
     if not record:
         raise HTTPException(status_code=404, detail="Отчет не найден")
     return record
@@ -83,24 +445,35 @@ async def update_report(
         record_id: int,
         input_data: InputData,
         request: Request,
+        response: Response,
+        chart_format: Optional[ChartFormat] = None,
         admin: User = Depends(get_current_admin)
 ):
     """3. Обновление рекорда (и перегенерация PDF)"""
-    old_record = db.get_by_id(record_id)
+    old_record = await asyncio.to_thread(db.get_by_id, record_id)
     if not old_record:
         raise HTTPException(status_code=404, detail="Отчет не найден")
+    if old_record["status"] in (database.STATUS_QUEUED, database.STATUS_RENDERING):
+        raise HTTPException(status_code=409, detail="Отчет еще генерируется")
 
-    # Генерируем новый PDF, так как данные изменились
-    report_filename = f"report_{uuid.uuid4()}.pdf"
-    report_filepath = os.path.join("media", report_filename)
-    generate_pdf_report(input_data.data.dict(), report_filepath)
-    link = f"{request.base_url}api/reports/media/{report_filename}".replace('http://', 'https://')
+    if LAZY_PDF:
+        # Новый PDF сгенерируется при следующем открытии: отпечаток данных изменится
+        link = lazy_report_link(str(request.base_url), old_record["token"])
+    else:
+        # Генерируем новый PDF, так как данные изменились
+        report_filename = f"report_{uuid.uuid4()}.pdf"
+        report_filepath = os.path.join("media", report_filename)
+        await render_report(
+            input_data.data.dict(), report_filepath, chart_format, requested_profile_path(request, response)
+        )
+        link = f"{request.base_url}api/reports/media/{report_filename}".replace('http://', 'https://')
 
     # Обновляем в БД
-    db.update(record_id, input_data.data.dict(), link)
+    await asyncio.to_thread(db.update, record_id, input_data.data.dict(), link, chart_format)
 
     # Удаляем старый файл с диска, если он был
-    if old_record.get("report_link"):
+    await asyncio.to_thread(pdf_cache.drop, record_id)
+    if old_record.get("report_link") and old_record["report_link"] != link:
         old_filename = old_record["report_link"].split("/")[-1]
         old_filepath = os.path.join("media", old_filename)
         if os.path.exists(old_filepath):
@@ -112,13 +485,14 @@ async def update_report(
 @router.delete("/{record_id}")
 async def delete_report(record_id: int, admin: User = Depends(get_current_admin)):
     """4. Удаление рекорда (и удаление PDF с диска)"""
-    old_record = db.get_by_id(record_id)
+    old_record = await asyncio.to_thread(db.get_by_id, record_id)
     if not old_record:
         raise HTTPException(status_code=404, detail="Отчет не найден")
 
-    db.delete(record_id)
+    await asyncio.to_thread(db.delete, record_id)
 
     # Удаляем файл с диска
+    await asyncio.to_thread(pdf_cache.drop, record_id)
     if old_record.get("report_link"):
         old_filename = old_record["report_link"].split("/")[-1]
         old_filepath = os.path.join("media", old_filename)
@@ -129,3 +503,5 @@ async def delete_report(record_id: int, admin: User = Depends(get_current_admin)
 
 
 app.include_router(router)
+# Монтируется после роутера, чтобы /api/reports/media/records/ обрабатывался get_report_pdf
+app.mount("/api/reports/media", MediaFiles(directory="media", accel_prefix=MEDIA_ACCEL_PREFIX), name="media")
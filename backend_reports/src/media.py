@@ -0,0 +1,117 @@
+"""
+Раздача PDF из media/ с HTTP-кешированием.
+
+Файлы отдаются с сильным ETag по хешу содержимого; Range и условные запросы обрабатывает
+FileResponse. Черновики (draft_*) и версии из кеша ленивых PDF после записи не меняются и
+отдаются с Cache-Control: immutable. Отчёты report_* - нет: restore_reports --all перегенерирует
+их под тем же именем, поэтому их кешируют со сверкой ETag. С accel_prefix файл отдаёт nginx
+по X-Accel-Redirect, а воркер приложения только проверяет путь.
+"""
+import functools
+import hashlib
+import os
+import stat
+from email.utils import parsedate
+from typing import Optional, Tuple
+from urllib.parse import quote
+
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+from starlette.types import Scope
+
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# Для ссылок, по которым со временем отдаётся другой файл (ленивые отчёты): кешировать, но сверять ETag
+REVALIDATE_CACHE_CONTROL = "no-cache"
+# Файлы, которые перезаписываются под тем же именем (restore_reports)
+REWRITABLE_PREFIX = "report_"
+
+
+@functools.lru_cache(maxsize=4096)
+def _content_etag(path: str, mtime_ns: int, size: int) -> str:
+    # mtime и размер в ключе: перезаписанный файл будет прочитан заново
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return f'"{digest.hexdigest()[:32]}"'
+
+
+def content_etag(path: str, stat_result: os.stat_result) -> str:
+    """ETag по sha256 содержимого; первый вызов для файла читает его целиком - не вызывать в event loop"""
+    return _content_etag(str(path), stat_result.st_mtime_ns, stat_result.st_size)
+
+
+def is_not_modified(response_headers: Headers, request_headers: Headers) -> bool:
+    """Можно ли ответить 304: If-None-Match по ETag, иначе If-Modified-Since"""
+    if_none_match = request_headers.get("if-none-match")
+    if if_none_match:
+        if if_none_match.strip() == "*":
+            return True
+        return response_headers["etag"] in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+
+    if_modified_since = parsedate(request_headers.get("if-modified-since") or "")
+    last_modified = parsedate(response_headers.get("last-modified") or "")
+    return bool(if_modified_since and last_modified and if_modified_since >= last_modified)
+
+
+def media_response(
+        full_path: str,
+        stat_result: os.stat_result,
+        request_headers: Headers,
+        cache_control: str = IMMUTABLE_CACHE_CONTROL,
+        accel_path: Optional[str] = None,
+        status_code: int = 200
+) -> Response:
+    """
+    Ответ с файлом из media/.
+
+    С accel_path тело отдаёт nginx (ETag, Range и условные запросы тогда тоже на нём),
+    иначе - FileResponse с ETag по содержимому и 304 на If-None-Match/If-Modified-Since.
+    """
+    if accel_path:
+        return Response(headers={"X-Accel-Redirect": quote(accel_path), "Cache-Control": cache_control})
+
+    response = FileResponse(
+        full_path,
+        status_code=status_code,
+        stat_result=stat_result,
+        headers={"ETag": content_etag(full_path, stat_result), "Cache-Control": cache_control}
+    )
+    if is_not_modified(response.headers, request_headers):
+        return NotModifiedResponse(response.headers)
+    return response
+
+
+class MediaFiles(StaticFiles):
+    """StaticFiles для PDF из media/: Cache-Control по типу файла (см. описание модуля), ответ - media_response"""
+
+    def __init__(self, *, directory: str, accel_prefix: Optional[str] = None, **kwargs):
+        super().__init__(directory=directory, **kwargs)
+        self.accel_prefix = accel_prefix
+
+    def lookup_path(self, path: str) -> Tuple[str, Optional[os.stat_result]]:
+        # lookup_path выполняется в потоке, а file_response - в event loop: хеш содержимого для ETag
+        # считается здесь, в file_response он берётся из кеша content_etag
+        full_path, stat_result = super().lookup_path(path)
+        if not self.accel_prefix and stat_result and stat.S_ISREG(stat_result.st_mode):
+            content_etag(full_path, stat_result)
+        return full_path, stat_result
+
+    def file_response(
+            self,
+            full_path,
+            stat_result: os.stat_result,
+            scope: Scope,
+            status_code: int = 200
+    ) -> Response:
+        relative_path = os.path.relpath(full_path, os.path.realpath(self.directory))
+        accel_path = f"{self.accel_prefix}{relative_path}" if self.accel_prefix else None
+        cache_control = IMMUTABLE_CACHE_CONTROL
+        if os.path.dirname(relative_path) == "" and relative_path.startswith(REWRITABLE_PREFIX):
+            cache_control = REVALIDATE_CACHE_CONTROL
+        return media_response(
+            str(full_path), stat_result, Headers(scope=scope), cache_control=cache_control,
+            accel_path=accel_path, status_code=status_code
+        )
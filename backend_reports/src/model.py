@@ -1,4 +1,4 @@
-from typing import List, Optional, Dict
+from typing import List, Literal, Optional, Dict
 from pydantic import BaseModel
 
 class SessionsAttended(BaseModel):
@@ -87,3 +87,8 @@ class LDPRReport(BaseModel):
 class InputData(BaseModel):
     user_id: int
     data: LDPRReport
+
+
+ChartFormat = Literal["png", "svg"]
+# link - ссылка на PDF в ответе, inline - сам PDF в теле ответа
+Delivery = Literal["link", "inline"]
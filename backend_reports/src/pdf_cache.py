@@ -0,0 +1,113 @@
+import contextlib
+import functools
+import hashlib
+import os
+import time
+import uuid
+from pathlib import Path
+from typing import Optional
+
+from src.assets import ASSETS_DIR
+
+
+SRC_DIR = Path(__file__).resolve().parent
+CACHED_PREFIX = "report_"
+EVICTION_INTERVAL = 60
+
+
+@functools.cache
+def template_version() -> str:
+    """Хеш шаблона отчёта: код вёрстки и стили. После изменения шаблона старые PDF из кеша не отдаются"""
+    digest = hashlib.sha256()
+    for path in [SRC_DIR / "pdf_creater.py", *sorted(ASSETS_DIR.rglob("*"))]:
+        if path.is_file():
+            digest.update(path.name.encode())
+            digest.update(path.read_bytes())
+    return digest.hexdigest()[:16]
+
+
+class PdfCache:
+    """
+    Кеш PDF, сгенерированных при первом обращении (режим LAZY_PDF).
+
+    Имя файла содержит ID записи, версию шаблона и отпечаток данных, поэтому правка отчёта
+    или шаблона сама по себе делает старый файл ненужным; такие файлы вытесняются первыми,
+    как давно не запрошенные, когда кеш превышает max_bytes.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._last_eviction = float("-inf")
+
+    def path(self, record_id: int, fingerprint: str) -> str:
+        filename = f"{CACHED_PREFIX}{record_id}_{template_version()}_{fingerprint[:16]}.pdf"
+        return os.path.join(self.cache_dir, filename)
+
+    def get(self, path: str) -> bool:
+        try:
+            # Обновляем mtime: при вытеснении первыми удаляются давно не запрошенные отчёты
+            os.utime(path)
+        except FileNotFoundError:
+            return False
+        return True
+
+    @contextlib.contextmanager
+    def write(self, path: str):
+        """
+        Временный путь для рендера; по выходу из блока файл атомарно занимает своё место в кеше.
+        Вытеснение (maybe_evict) вызывающий запускает сам, из async-кода - в потоке
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            yield tmp_path
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def drop(self, record_id: int):
+        """Удаление всех закешированных версий отчёта записи"""
+        if not os.path.isdir(self.cache_dir):
+            return
+        prefix = f"{CACHED_PREFIX}{record_id}_"
+        with os.scandir(self.cache_dir) as entries:
+            for entry in entries:
+                if entry.name.startswith(prefix):
+                    self._remove(entry.path)
+
+    def maybe_evict(self, keep: Optional[str] = None):
+        # Каталог сканируется не чаще раза в EVICTION_INTERVAL
+        if time.monotonic() - self._last_eviction >= EVICTION_INTERVAL:
+            self._last_eviction = time.monotonic()
+            self.evict(keep=keep)
+
+    def evict(self, keep: Optional[str] = None):
+        """Удаление давно не запрошенных отчётов, пока размер кеша больше max_bytes"""
+        files = []
+        with os.scandir(self.cache_dir) as entries:
+            for entry in entries:
+                if not (entry.name.startswith(CACHED_PREFIX) and entry.name.endswith(".pdf")):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            self._remove(path)
+            total -= size
+
+    @staticmethod
+    def _remove(path: str):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
@@ -1,12 +1,51 @@
 from weasyprint import HTML
+import base64
+import functools
+import io
 import json
 import pymorphy3
-import os
-import uuid
-import pathlib
 import matplotlib.pyplot as plt
 import matplotlib.transforms as mtrans
 
+from src.assets import ASSETS_URL, offline_url_fetcher, get_font_config, load_stylesheets
+from src.profiling import measure_stages, stage
+
+# Высота строки диаграммы (дюймы) и добавка на каждую дополнительную строку подписи (в долях строки)
+CHART_ROW_HEIGHT_INCHES = 0.52
+CHART_EXTRA_LINE_HEIGHT = 0.42
+CHART_STYLE = "max-width: 100%; height: auto;"
+
+# Растровая диаграмма (PNG 300 dpi) или векторная, встроенная в HTML как <svg>
+CHART_FORMAT_PNG = "png"
+CHART_FORMAT_SVG = "svg"
+
+# Статические стили отчёта из src/assets, порядок важен
+REPORT_STYLESHEETS = ("reset.css", "report.css")
+
+
+@functools.cache
+def get_morph():
+    """MorphAnalyzer на весь процесс: словарь OpenCorpora загружается один раз"""
+    return pymorphy3.MorphAnalyzer()
+
+
+@functools.lru_cache(maxsize=1024)
+def _inflect(word, case, number):
+    return get_morph().parse(word)[0].inflect({case, number}).word
+
+
+def inflect(word, case, number):
+    with stage("morph"):
+        return _inflect(word, case, number)
+
+
+def warm_up():
+    """Прогрев процесса-воркера: словарь, частые словоформы и стили загружаются до первого отчёта"""
+    inflect("достижение", "nomn", "sing")
+    inflect("достижения", "nomn", "plur")
+    load_stylesheets(*REPORT_STYLESHEETS)
+
+
 def load_json_data(filename):
     with open(filename, 'r', encoding='utf-8') as file:
         return json.load(file)
@@ -68,8 +107,7 @@ def declense_noun(noun, count):
             return "встреч"
     return noun
 
-def generate_bar_chart(data):
-    output_paths = []
+def generate_bar_chart(data, chart_format=CHART_FORMAT_PNG):
     # Prepare and sort data
     categories = {
         "ЖКХ": data['citizen_requests']['requests'].get('utilities', 0),
@@ -108,79 +146,98 @@ def generate_bar_chart(data):
     # Convert to integers and filter zero values
     categories = {k: int(v) if str(v).isdigit() else 0 for k, v in categories.items()}
     max_value = max(categories.values()) if categories.values() else 10  # Default max for empty data
-    sorted_categories = sorted(categories.items(), key=lambda x: x[1], reverse=True)
-
+    sorted_categories = [
+        (category, count)
+        for category, count in sorted(categories.items(), key=lambda x: x[1], reverse=True)
+        if count != 0
+    ]
+    if not sorted_categories:
+        return [], sum(categories.values())
+
+    # Все категории рисуются на одной фигуре: строка с переносом в подписи выше обычной,
+    # столбец прижат к нижней границе своей строки, как было при отдельной картинке на категорию
+    rows = []
+    top = 0
     for category, count in sorted_categories:
-        if count == 0:
-            continue
-        chart_filename = f"tmp/chart_{uuid.uuid4()}.png"
-        chart_abs_path = str(pathlib.Path.cwd() / chart_filename)
-        output_paths.append(chart_abs_path)
-
-        labels = [category]
-        values = [count]
-
-        # Colors setup
-        colors = ['#394B8C']
-
-        # Create figure with dynamic size, учитывая количество строк
-        fig, ax = plt.subplots(figsize=(10, 0.4))
-        ax.set_xlim([0.2, max_value * 1.1])
-        # Create horizontal bars
-        bars = ax.barh(labels, values, color=colors, height=0.6, edgecolor=colors, linewidth=2)
-
-        for bar, value in zip(bars, values):
-            if value >= 0:
-                text_x = bar.get_width() * 0.95 if value > max_value / 15 else bar.get_width() + max_value * 0.02
-                ha = 'right' if value > max_value / 15 else 'left'
-                color = 'white' if value > max_value / 15 else 'black'
-                ax.text(text_x, bar.get_y() + bar.get_height()/2, f'{int(value)}',
-                        va='center', ha=ha, color=color, fontsize=14, fontweight='bold')
-
-        # Customize axes
-        ax.xaxis.set_visible(False)
-        ax.yaxis.set_visible(False)
-        ax.spines['bottom'].set_visible(False)
-        ax.spines['top'].set_visible(False)
-        ax.spines['right'].set_visible(False)
-        ax.spines['left'].set_visible(False)
-
-        for i, (label, color) in enumerate(zip(labels, colors)):
+        row_height = 1 + CHART_EXTRA_LINE_HEIGHT * category.count("\n")
+        rows.append((category, count, top - row_height + 0.5))
+        top -= row_height
+
+    colors = ['#394B8C']
+    fig, ax = plt.subplots(figsize=(10, -top * CHART_ROW_HEIGHT_INCHES))
+    ax.set_xlim([0.2, max_value * 1.1])
+    ax.set_ylim([top, 0])
+
+    labels = [category for category, _, _ in rows]
+    values = [count for _, count, _ in rows]
+    positions = [y for _, _, y in rows]
+
+    # Create horizontal bars
+    bars = ax.barh(positions, values, color=colors, height=0.6, edgecolor=colors, linewidth=2)
+
+    for bar, value in zip(bars, values):
+        if value >= 0:
+            text_x = bar.get_width() * 0.95 if value > max_value / 15 else bar.get_width() + max_value * 0.02
+            ha = 'right' if value > max_value / 15 else 'left'
+            color = 'white' if value > max_value / 15 else 'black'
+            ax.text(text_x, bar.get_y() + bar.get_height()/2, f'{int(value)}',
+                    va='center', ha=ha, color=color, fontsize=14, fontweight='bold')
+
+    # Customize axes
+    ax.xaxis.set_visible(False)
+    ax.yaxis.set_visible(False)
+    ax.spines['bottom'].set_visible(False)
+    ax.spines['top'].set_visible(False)
+    ax.spines['right'].set_visible(False)
+    ax.spines['left'].set_visible(False)
+
+    for label, y in zip(labels, positions):
+        trans = mtrans.offset_copy(ax.get_yaxis_transform(), 
+            y=0, fig=fig, units='points'
+        )
+        if "\n" in label:
             trans = mtrans.offset_copy(ax.get_yaxis_transform(), 
-                y=0, fig=fig, units='points'
+                y=8, fig=fig, units='points'
             )
-            if "\n" in category:
-                trans = mtrans.offset_copy(ax.get_yaxis_transform(), 
-                    y=8, fig=fig, units='points'
-                )
 
-            ax.text(-0.01, i, label, ha='right', va='center', fontfamily='DejaVu Sans Mono',
-                    color="black", fontsize=16, fontweight='bold', transform=trans,
-                    bbox=dict(boxstyle='square,pad=0', edgecolor='none', facecolor='none', linewidth=0))
-            ax.axhline(y=i-0.3, xmin=-0.64, xmax=0.1, color=color, linewidth=2, clip_on=False)
+        ax.text(-0.01, y, label, ha='right', va='center', fontfamily='DejaVu Sans Mono',
+                color="black", fontsize=16, fontweight='bold', transform=trans,
+                bbox=dict(boxstyle='square,pad=0', edgecolor='none', facecolor='none', linewidth=0))
+        ax.axhline(y=y-0.3, xmin=-0.64, xmax=0.1, color=colors[0], linewidth=2, clip_on=False)
 
-        plt.subplots_adjust(left=0.3, right=0.9, top=0.9, bottom=0.1)
-        try:
-            plt.savefig(chart_abs_path, dpi=300, bbox_inches='tight', transparent=True)
-            plt.close()
-        except Exception as e:
-            print(f"Error saving chart image: {e}")
-            raise
-    return output_paths, sum(categories.values())
+    plt.subplots_adjust(left=0.3, right=0.9, top=1, bottom=0)
+    buffer = io.BytesIO()
+    try:
+        if chart_format == CHART_FORMAT_SVG:
+            fig.savefig(buffer, format='svg', bbox_inches='tight', transparent=True)
+        else:
+            fig.savefig(buffer, format='png', dpi=300, bbox_inches='tight', transparent=True)
+    except Exception as e:
+        print(f"Error saving chart image: {e}")
+        raise
+    finally:
+        plt.close(fig)
 
+    if chart_format == CHART_FORMAT_SVG:
+        # Встраиваем <svg> прямо в HTML, отрезав XML-декларацию и DOCTYPE
+        svg = buffer.getvalue().decode('utf-8')
+        svg = svg[svg.index('<svg'):].replace('<svg', f'<svg style="{CHART_STYLE}"', 1)
+        return [svg], sum(categories.values())
 
-def generate_html_report(data):
-    morph = pymorphy3.MorphAnalyzer()
+    chart_src = f"data:image/png;base64,{base64.b64encode(buffer.getvalue()).decode('ascii')}"
+    return [f'<img src="{chart_src}" style="{CHART_STYLE}">'], sum(categories.values())
 
+
+def generate_html_report(data, chart_format=CHART_FORMAT_PNG):
     def format_list(items, singular, plural, case='nomn', item_format=lambda x: x):
         if not items:
             return f"не {plural}."
         count = len(items)
         if count == 1:
-            noun = morph.parse(singular)[0].inflect({case, 'sing'}).word
+            noun = inflect(singular, case, 'sing')
             return f"{noun}: <ul class='list-disc pl-6'><li>{item_format(items[0])}</li></ul>"
         else:
-            noun = morph.parse(plural)[0].inflect({case, 'plur'}).word
+            noun = inflect(plural, case, 'plur')
             items_html = ''.join(f'<li class="mb-2">{item_format(item)}</li>' for item in items)
             return f"{noun}: <ul class='list-disc pl-6'>{items_html}</ul>"
 
@@ -294,8 +351,9 @@ def generate_html_report(data):
     responses = declense_noun("ответ", data['citizen_requests']['responses'])
     official_queries = declense_noun("запрос", data['citizen_requests']['official_queries'])
 
-    images_paths, requests_count = generate_bar_chart(data)
-    images_text = "".join(f'<img src="file://{image_path}" style="max-width: 100%; height: auto;">' for image_path in images_paths)
+    with stage("chart"):
+        charts, requests_count = generate_bar_chart(data, chart_format)
+    images_text = "".join(charts)
     ldpr_requests_text = f"""
     <p class="mt-4 big"><strong>Получено обращений на имя Председателя ЛДПР: <b>{data['citizen_requests']['requests'].get('appeals_to_ldpr_chairman', 0)}</b></strong></p>
     """ if int(data['citizen_requests']['requests'].get('appeals_to_ldpr_chairman', 0)) > 0 else ""
@@ -328,100 +386,6 @@ def generate_html_report(data):
     <head>
         <meta charset="UTF-8">
         <title>ОТЧЁТ ДЕЯТЕЛЬНОСТИ ДЕПУТАТА ЛДПР</title>
-        <link href="https://fonts.googleapis.com/css2?family=Geologica:wght@400;500;600&display=swap" rel="stylesheet">
-        <link href="https://fonts.googleapis.com/css2?family=Bebas+Neue&display=swap" rel="stylesheet">
-        <link href="https://cdnjs.cloudflare.com/ajax/libs/meyer-reset/2.0/reset.min.css" rel="stylesheet">
-        <style>
-            * {{ -webkit-font-smoothing: antialiased; box-sizing: border-box; }}
-            body {{ font-family: 'Geologica', sans-serif; font-size: 14px; line-height: 15.2px; color: #000000; background: #FFFFFF; margin: 0; height: 100%;
-            width: 21cm;}}
-            .big {{font-size: 18px}}
-            .container {{ width: 720px; margin: 0 auto; padding: 0 24px; margin-top: 40px; }}
-            .ldpr-yellow {{ background-color: #FFC531; }}
-            .ldpr-blue {{ color: #394B8C; }}
-            .text-ldpr-blue {{ color: #394B8C; text-decoration: underline; }}
-            .status-green {{ color: #097903; }}
-            .status-red {{ color: #FF0000; }}
-            .header {{
-                position: relative;
-                text-align: center;
-                background: #394B8C;
-                color: #FFFFFF;
-                margin-bottom: 12px;
-                border-radius: 0 0 20px 20px;
-                height: 171.4px; /* Фиксированная высота для согласованности */
-                padding-top: 20px;
-                padding-bottom: 20px;
-            }}             
-           .header-content {{
-                flex-grow: 1;
-                padding: 0 20px;
-                margin-right: 140px
-            }}
-            .header-content h1.first {{ font-family: 'Geologica', sans-serif; font-size: 44px; font-weight: 400; text-transform: uppercase; line-height: 44px; margin-bottom: 6px; font-weight: 700;}}
-            .header h1.second {{ font-family: 'Geologica', sans-serif; font-size: 44px; font-weight: 400; text-transform: uppercase; line-height: 44px; margin-bottom: 6px; font-weight: 700;}}
-            .header h2 {{ font-family: 'Geologica', sans-serif; font-weight: 600; font-size: 16px; line-height: 17px; margin-top: 8px;}}
-            .header p {{ font-family: 'Geologica', sans-serif; font-weight: 400; font-size: 12px; line-height: 14.4px; text-align: center; }}
-            .section-container {{ margin-bottom: 29px; position: relative; }}
-            h3 {{ font-family: 'Geologica', sans-serif; font-weight: 600; font-size: 26px; line-height: 22px; color: #000000; background: #ccd8e8; padding: 3px 0; margin-bottom: 20px; width: 100%; }}
-            h4 {{ text-align: center; }}
-            p {{ 
-                margin: 0 0 6px 0; 
-                # text-align: justify; 
-                font-family: 'Geologica',
-                sans-serif; font-weight: 400;
-                font-size: 14.0px; line-height: 15.2px; 
-                word-break: break-all;
-                overflow-wrap: break-word;            
-            }}
-            ul.list-disc {{ margin: 7px 0 6px 0; padding-left: 20px; list-style: none; }}
-            ul.list-disc li {{ position: relative; padding-left: 20px; list-style-type: none; padding-bottom: 10px}}
-            ul.list-disc li.small {{ padding-bottom: 0px; word-break: break-all}}
-            ul.list-disc li::before {{
-  content: ''; 
-  background-image: url("data:image/svg+xml;base64,PHN2ZyB3aWR0aD0iNjYiIGhlaWdodD0iNjIiIHZpZXdCb3g9IjAgMCA2NiA2MyIgZmlsbD0ibm9uZSIgeG1sbnM9Imh0dHA6Ly93d3cudzMub3JnLzIwMDAvc3ZnIj4KPHBhdGggZD0iTTM1Ljk1NTYgMjcuOTQyM0w0MC4yOTg2IDAuMzgwODU5SDI1LjI2NTFMMjkuNjA4MSAyNy45NDIzTDQuNzE5MzEgMTUuNDE0NEwwLjA0MjIyMTM0IDI5LjYxMjdMMjcuNDM2NiAzNC4yODk4TDcuODkzMDUgNTMuODMzM0wxOS45MTk5IDYyLjY4NjRMMzIuNzgxOCAzNy45NjQ2TDQ1LjY0MzkgNjIuNjg2NEw1Ny42NzA3IDUzLjgzMzNMMzguMTI3MSAzNC4yODk4TDY1LjUyMTUgMjkuNjEyN0w2MC44NDQ0IDE1LjQxNDRMMzUuOTU1NiAyNy45NDIzWiIgZmlsbD0iIzNCODJGNiIvPgo8L3N2Zz4K"); 
-  background-repeat: no-repeat; 
-  background-size: contain; 
-  position: absolute; 
-  left: 0; 
-  width: 12px; 
-  height: 12px; 
-  top: 3px; 
-}}
-            .table-container {{ background: #EAF1F9; border-radius: 20px; margin: 15px 0; padding: 10px; padding-left: 20px; text-align: center; }}
-            strong {{ font-weight: 600; }}
-            b {{ font-weight: 900; }}
-            @page {{ size: A4; margin: 1cm 0cm 1cm 0cm; }}
-            @page :first {{ margin: 0cm 0cm 1cm 0cm; }}
-            @page {{ @bottom-right {{ content: counter(page) " / " counter(pages); font-family: 'Geologica', sans-serif; border-top-left-radius: 6px; font-size: 10px; color: #FFFFFF; background: #394B8C; height: 20px; line-height: 0px; padding-left: 8px; padding-right: 8px; text-align: center; margin-top: 20px; }} }}
-.header-decoration {{
-    position: absolute;
-    top: 0;
-    width: 171.4px;
-    height: 171.4px;
-}}
-.header-decoration.left {{
-    left: 0;
-}}
-.header-decoration.right {{
-    right: 0;
-}}
-.header-decoration img {{
-    height: 100%;
-    width: 100%;
-    display: block; /* Убирает возможные отступы */
-}}
-.header-decoration.left img {{
-    border-radius: 0 0 0 20px;
-}}
-
-.header-decoration.right img {{
-    border-radius: 0 0 20px 0;
-}}
-
-.header-content {{
-}}
-        </style>
     </head>
     <body>
 <div class="header">
@@ -499,21 +463,38 @@ def generate_html_report(data):
     </html>
     """
 
-    return html_content, images_paths
+    return html_content
 
 
-def generate_pdf_report(json_data, output_filename, debug=False):
-    html_content, images_paths = generate_html_report(json_data)
+def generate_pdf_report(json_data, output_filename, debug=False, chart_format=CHART_FORMAT_PNG, profile_path=None):
+    """Генерация PDF; возвращает длительность этапов в секундах (morph, chart, html, layout, write, total)"""
+    return measure_stages(
+        _generate_pdf_report, json_data, output_filename, debug, chart_format, profile_path=profile_path
+    )
 
-    try:
-        HTML(string=html_content).write_pdf(output_filename)
-        if debug:
-            with open("debug.html", "w", encoding="utf-8") as f:
-                f.write(html_content)
-    finally:
-        for image_path in images_paths:
-            if os.path.exists(image_path):
-                os.remove(image_path)
+
+def generate_pdf_bytes(json_data, chart_format=CHART_FORMAT_PNG, profile_path=None):
+    """Генерация PDF в память; возвращает байты PDF и длительность этапов"""
+    buffer = io.BytesIO()
+    timings = generate_pdf_report(json_data, buffer, chart_format=chart_format, profile_path=profile_path)
+    return buffer.getvalue(), timings
+
+
+def _generate_pdf_report(json_data, output_filename, debug, chart_format):
+    with stage("html"):
+        html_content = generate_html_report(json_data, chart_format)
+
+    # Шрифты установлены в образ, остальные ресурсы берутся из src/assets - сеть при рендере не нужна
+    with stage("layout"):
+        document = HTML(string=html_content, base_url=ASSETS_URL, url_fetcher=offline_url_fetcher).render(
+            stylesheets=load_stylesheets(*REPORT_STYLESHEETS),
+            font_config=get_font_config()
+        )
+    with stage("write"):
+        document.write_pdf(output_filename)
+    if debug:
+        with open("debug.html", "w", encoding="utf-8") as f:
+            f.write(html_content)
 
 
 if __name__ == "__main__":
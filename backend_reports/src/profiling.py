@@ -0,0 +1,82 @@
+"""
+Замеры этапов генерации отчёта.
+
+Генерация идёт в процессах пула, поэтому этапы замеряются в воркере, generate_pdf_report
+возвращает словарь {этап: секунды}, а в гистограмму его записывает основной процесс.
+"""
+import contextlib
+import contextvars
+import cProfile
+import time
+from collections import defaultdict
+from typing import Callable, Dict, Optional
+
+from prometheus_client import Histogram
+
+
+RENDER_STAGE_SECONDS = Histogram(
+    "report_render_stage_seconds",
+    "Длительность этапов генерации PDF отчёта",
+    ["stage"],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+)
+# Заголовок запроса, по которому генерация идёт под cProfile (если включено PROFILE_REQUESTS)
+PROFILE_HEADER = "X-Profile"
+
+_current_timer: contextvars.ContextVar = contextvars.ContextVar("stage_timer", default=None)
+
+
+class StageTimer:
+    """Сумма времени по этапам; время вложенного этапа не входит во внешний"""
+
+    def __init__(self):
+        self.timings: Dict[str, float] = defaultdict(float)
+        self._nested = []
+
+    @contextlib.contextmanager
+    def measure(self, name: str):
+        started = time.perf_counter()
+        self._nested.append(0.0)
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self.timings[name] += elapsed - self._nested.pop()
+            if self._nested:
+                self._nested[-1] += elapsed
+
+
+@contextlib.contextmanager
+def stage(name: str):
+    """Этап генерации; вне measure_stages ничего не замеряет"""
+    timer = _current_timer.get()
+    if timer is None:
+        yield
+        return
+    with timer.measure(name):
+        yield
+
+
+def measure_stages(func: Callable, *args, profile_path: Optional[str] = None, **kwargs) -> Dict[str, float]:
+    """Вызов func с замером этапов; с profile_path ещё и под cProfile, статистика пишется в этот файл"""
+    timer = StageTimer()
+    token = _current_timer.set(timer)
+    profiler = cProfile.Profile() if profile_path else None
+    started = time.perf_counter()
+    try:
+        if profiler:
+            profiler.enable()
+        func(*args, **kwargs)
+    finally:
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(profile_path)
+        _current_timer.reset(token)
+    timings = dict(timer.timings)
+    timings["total"] = time.perf_counter() - started
+    return timings
+
+
+def observe_stages(timings: Optional[Dict[str, float]]):
+    for name, seconds in (timings or {}).items():
+        RENDER_STAGE_SECONDS.labels(stage=name).observe(seconds)
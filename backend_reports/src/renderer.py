@@ -0,0 +1,164 @@
+import asyncio
+import functools
+import logging
+import multiprocessing
+import signal
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, Optional
+
+from src.config import RENDER_WORKERS, RENDER_TIMEOUT, RENDER_QUEUE_SIZE, CHART_FORMAT
+from src.pdf_creater import generate_pdf_bytes, generate_pdf_report, warm_up
+from src.profiling import observe_stages
+
+
+class RenderQueueFull(Exception):
+    pass
+
+
+class RenderTimeout(Exception):
+    pass
+
+
+# Сколько секунд сверх timeout ждать процесс, который не прервался сам (завис в нативном коде),
+# прежде чем пул будет остановлен принудительно
+KILL_GRACE = 30
+
+
+def _raise_timeout(signum, frame):
+    raise RenderTimeout('Генерация отчёта прервана по таймауту')
+
+
+def run_with_deadline(job: Callable[[], Any], timeout: float) -> Any:
+    """
+    Выполнение job в процессе пула с ограничением по времени: отсчёт идёт с фактического
+    начала генерации, а не с постановки в очередь. Воркер пула выполняет задачи
+    в главном потоке, поэтому прерывание через SIGALRM освобождает процесс для следующих задач
+    """
+    previous = signal.signal(signal.SIGALRM, _raise_timeout)
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        return job()
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+class ReportRenderer:
+    """Генерация PDF в пуле процессов, чтобы не блокировать event loop"""
+
+    def __init__(
+            self,
+            workers: int = RENDER_WORKERS,
+            timeout: float = RENDER_TIMEOUT,
+            queue_size: int = RENDER_QUEUE_SIZE
+    ):
+        self.workers = workers
+        self.timeout = timeout
+        self.queue_size = queue_size
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._slots: Optional[asyncio.BoundedSemaphore] = None
+        self._running: Optional[asyncio.BoundedSemaphore] = None
+
+    def start(self):
+        self._executor = self._create_executor()
+        self._slots = asyncio.BoundedSemaphore(self.queue_size)
+        # В пул отдаётся не больше задач, чем в нём процессов: отданная задача сразу начинает выполняться
+        self._running = asyncio.BoundedSemaphore(self.workers)
+
+    def _create_executor(self) -> ProcessPoolExecutor:
+        # spawn, а не fork: родительский процесс уже держит потоки uvicorn
+        executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=warm_up
+        )
+        # Процессы поднимаются сразу, чтобы прогрев не ложился на первые отчёты
+        for _ in range(self.workers):
+            executor.submit(warm_up)
+        return executor
+
+    def shutdown(self):
+        if self._executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def is_full(self) -> bool:
+        return self._slots is not None and self._slots.locked()
+
+    async def render(
+            self,
+            data: Dict[str, Any],
+            output_filename: str,
+            chart_format: str = CHART_FORMAT,
+            profile_path: Optional[str] = None,
+            wait: bool = False
+    ) -> Dict[str, float]:
+        """
+        Генерация отчёта в файл в отдельном процессе; возвращает длительность этапов, они же пишутся в метрики.
+
+        С profile_path генерация идёт под cProfile, статистика сохраняется в этот файл.
+        С wait=True при переполненной очереди ждёт свободного места (фоновые задачи), см. _run.
+        """
+        timings = await self._run(functools.partial(
+            generate_pdf_report, data, output_filename, chart_format=chart_format, profile_path=profile_path
+        ), wait=wait)
+        observe_stages(timings)
+        return timings
+
+    async def render_bytes(
+            self,
+            data: Dict[str, Any],
+            chart_format: str = CHART_FORMAT,
+            profile_path: Optional[str] = None
+    ) -> bytes:
+        """Генерация отчёта в память: PDF возвращается байтами, без записи на диск в процессе пула"""
+        pdf, timings = await self._run(functools.partial(
+            generate_pdf_bytes, data, chart_format=chart_format, profile_path=profile_path
+        ))
+        observe_stages(timings)
+        return pdf
+
+    async def _run(self, job: Callable[[], Any], wait: bool = False) -> Any:
+        """
+        Выполнение job в пуле.
+
+        Если в работе уже queue_size задач, сразу бросает RenderQueueFull, а с wait=True
+        ждёт, пока место освободится: так генерируются уже принятые фоновые задачи.
+        Генерация дольше timeout прерывается в самом процессе пула (RenderTimeout, см. run_with_deadline).
+        Если процесс завис и не прервался, пул останавливается и пересоздаётся; задачи,
+        выполнявшиеся в нём одновременно, при этом получают BrokenProcessPool.
+        """
+        if self._executor is None:
+            self.start()
+        if not wait and self.is_full():
+            raise RenderQueueFull('Очередь генерации отчётов переполнена')
+
+        async with self._slots, self._running:
+            loop = asyncio.get_running_loop()
+            executor = self._executor
+            try:
+                future = loop.run_in_executor(executor, run_with_deadline, job, self.timeout)
+                return await asyncio.wait_for(future, self.timeout + KILL_GRACE)
+            except asyncio.TimeoutError:
+                if self._executor is executor:
+                    logging.error('Процесс генерации отчёта завис, перезапуск пула')
+                    self._recycle(executor, kill=True)
+                raise RenderTimeout(f'Генерация отчёта заняла больше {self.timeout} с')
+            except BrokenProcessPool:
+                # Процесс пула упал (например, OOM) - пересоздаём пул для следующих задач.
+                # Ошибку получают все задачи сломанного пула, пересоздаёт его только первая:
+                # иначе следующие остановили бы уже новый пул вместе с чужими задачами
+                if self._executor is executor:
+                    logging.exception('Пул генерации отчётов сломан, перезапуск')
+                    self._recycle(executor)
+                raise
+
+    def _recycle(self, executor: ProcessPoolExecutor, kill: bool = False):
+        """Замена пула новым; с kill=True процессы старого пула завершаются, а не дорабатывают задачи"""
+        self._executor = self._create_executor()
+        if kill:
+            # Публичного способа остановить процессы пула до Python 3.14 нет
+            for process in list((getattr(executor, '_processes', None) or {}).values()):
+                process.kill()
+        executor.shutdown(wait=False, cancel_futures=True)
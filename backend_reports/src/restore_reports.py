@@ -1,53 +1,157 @@
-import os
+"""
+Массовая перегенерация PDF отчётов.
+
+По умолчанию восстанавливает отчёты без ссылки. С --all перегенерирует все отчёты
+(например, после изменения шаблона): файлы заменяются под теми же именами, ссылки не меняются.
+У отчётов с ленивой ссылкой (LAZY_PDF) PDF не генерируется, а удаляется из кеша: он будет
+сгенерирован заново при следующем открытии ссылки.
+Отчёты генерируются параллельно в пуле процессов; выполненные ID пишутся в checkpoint,
+и повторный запуск с --resume продолжает с места падения.
+
+    python -m src.restore_reports --all --workers 8 --resume
+    python -m src.restore_reports --ids 12 15 --chart-format svg
+"""
+import argparse
 import json
+import multiprocessing
+import os
+import time
 import uuid
-import sqlite3
-from src.pdf_creater import generate_pdf_report
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import date
+
+from src.config import CHART_FORMAT, RENDER_WORKERS, PDF_CACHE_DIR, PDF_CACHE_MAX_BYTES
+from src.database import STATUS_DONE, Database
+from src.pdf_cache import PdfCache
+from src.pdf_creater import generate_pdf_report, warm_up
 
 
-DB_PATH = "reports_db.sqlite3"
 MEDIA_DIR = "media"
 BASE_URL = "https://депутатлдпр.рф/api/reports/media/"
+CHECKPOINT_PATH = "restore_checkpoint.jsonl"
+# Ссылки LAZY_PDF: .../media/records/<token>.pdf, файл по ним отдаётся из кеша PdfCache
+LAZY_LINK_PART = "/media/records/"
 
 
-def restore():
-    if not os.path.exists(MEDIA_DIR):
-        os.makedirs(MEDIA_DIR)
-
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
+def parse_args():
+    parser = argparse.ArgumentParser(description="Массовая перегенерация PDF отчётов")
+    selection = parser.add_mutually_exclusive_group()
+    selection.add_argument("--all", action="store_true", help="все отчёты, а не только без ссылки")
+    selection.add_argument("--ids", type=int, nargs="+", help="только указанные ID")
+    parser.add_argument("--date-from", type=date.fromisoformat, help="дата создания от, YYYY-MM-DD")
+    parser.add_argument("--date-to", type=date.fromisoformat, help="дата создания до (включительно), YYYY-MM-DD")
+    parser.add_argument("--workers", type=int, default=RENDER_WORKERS, help="число процессов генерации")
+    parser.add_argument("--chart-format", choices=("png", "svg"), default=CHART_FORMAT)
+    parser.add_argument("--checkpoint", default=CHECKPOINT_PATH, help="файл с уже обработанными ID")
+    parser.add_argument("--resume", action="store_true", help="пропустить ID из checkpoint")
+    return parser.parse_args()
 
-    # Выбираем записи, где нет ссылки
-    cursor.execute("SELECT id, data FROM records WHERE report_link IS NULL")
-    rows = cursor.fetchall()
 
-    print(f"Найдено записей для восстановления: {len(rows)}")
+def load_checkpoint(path):
+    if not os.path.exists(path):
+        return set()
+    with open(path, encoding="utf-8") as file:
+        return {json.loads(line)["id"] for line in file if line.strip()}
 
-    for row in rows:
-        record_id = row['id']
-        try:
-            data = json.loads(row['data'])
 
-            # Генерируем новое имя файла
-            report_filename = f"report_{uuid.uuid4()}.pdf"
-            report_filepath = os.path.join(MEDIA_DIR, report_filename)
+def report_filename(record):
+    # Отчёт с существующей ссылкой перезаписывается под тем же именем, чтобы ссылка осталась рабочей
+    if record.get("report_link"):
+        return record["report_link"].split("/")[-1]
+    return f"report_{uuid.uuid4()}.pdf"
 
-            # Генерируем PDF
-            print(f"Генерация отчета для ID {record_id}...")
-            generate_pdf_report(data, report_filepath)
 
-            new_link = f"{BASE_URL}{report_filename}"
-            conn.execute("UPDATE records SET report_link = ? WHERE id = ?", (new_link, record_id))
-            conn.commit()
-
-            print(f"Успешно восстановлено: ID {record_id} -> {report_filename}")
-
-        except Exception as e:
-            print(f"Ошибка при восстановлении ID {record_id}: {e}")
-
-    conn.close()
-    print("Восстановление завершено.")
+def restore():
+    args = parse_args()
+    os.makedirs(MEDIA_DIR, exist_ok=True)
+
+    db = Database()
+    ids = db.find_ids(
+        missing_only=not (args.all or args.ids),
+        ids=args.ids,
+        date_from=args.date_from,
+        date_to=args.date_to
+    )
+    if args.resume:
+        done_ids = load_checkpoint(args.checkpoint)
+        ids = [record_id for record_id in ids if record_id not in done_ids]
+    elif os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
+
+    total = len(ids)
+    print(f"Найдено записей для перегенерации: {total}")
+    if not total:
+        db.close()
+        return
+
+    done = failed = 0
+    started = time.monotonic()
+    pending = {}
+    queue = iter(ids)
+    pdf_cache = PdfCache(PDF_CACHE_DIR, PDF_CACHE_MAX_BYTES)
+    executor = ProcessPoolExecutor(
+        max_workers=args.workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=warm_up
+    )
+
+    def submit_next():
+        # В очереди пула не больше двух задач на процесс: данные отчётов не грузятся в память все сразу
+        nonlocal done
+        for record_id in queue:
+            record = db.get_by_id(record_id)
+            if not record:
+                continue
+            if LAZY_LINK_PART in (record.get("report_link") or ""):
+                pdf_cache.drop(record_id)
+                checkpoint.write(json.dumps({"id": record_id, "file": None}) + "\n")
+                checkpoint.flush()
+                done += 1
+                print(f"ID {record_id}: ленивая ссылка, PDF удалён из кеша и будет сгенерирован при открытии")
+                continue
+            filename = report_filename(record)
+            tmp_path = os.path.join(MEDIA_DIR, f".{filename}.{uuid.uuid4().hex}.tmp")
+            future = executor.submit(generate_pdf_report, record["data"], tmp_path, chart_format=args.chart_format)
+            pending[future] = (record, filename, tmp_path)
+            return True
+        return False
+
+    with executor, open(args.checkpoint, "a", encoding="utf-8") as checkpoint:
+        while len(pending) < args.workers * 2 and submit_next():
+            pass
+
+        while pending:
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                record, filename, tmp_path = pending.pop(future)
+                try:
+                    future.result()
+                    os.replace(tmp_path, os.path.join(MEDIA_DIR, filename))
+                    if record["status"] != STATUS_DONE or not record.get("report_link"):
+                        # Восстановленная неудачная задача становится готовой и попадает в сводку
+                        db.set_status(record["id"], STATUS_DONE, report_link=f"{BASE_URL}{filename}")
+                    checkpoint.write(json.dumps({"id": record["id"], "file": filename}) + "\n")
+                    checkpoint.flush()
+                    done += 1
+                except Exception as e:
+                    failed += 1
+                    if os.path.exists(tmp_path):
+                        os.remove(tmp_path)
+                    print(f"Ошибка при перегенерации ID {record['id']}: {e}")
+
+                elapsed = time.monotonic() - started
+                processed = done + failed
+                rate = processed / elapsed if elapsed else 0.0
+                eta = (total - processed) / rate if rate else 0.0
+                print(
+                    f"[{processed}/{total}] ID {record['id']} -> {filename} | "
+                    f"{rate:.2f} отч/с, осталось ~{eta:.0f} с"
+                )
+                submit_next()
+
+    db.close()
+    elapsed = time.monotonic() - started
+    print(f"Перегенерация завершена: успешно {done}, с ошибками {failed}, за {elapsed:.1f} с.")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,179 @@
+"""
+Очистка media/ и tmp/ от файлов, которые не нужны ни одной записи.
+
+Осиротевшие PDF остаются, если сервис упал между генерацией и сохранением ссылки или
+не смог удалить старый файл при изменении/удалении отчёта; *.tmp - от прерванной генерации
+в restore_reports и кеше ленивых PDF; tmp/ - от старых версий генерации диаграмм.
+В сервисе очистка включается SWEEP_INTERVAL и идёт в фоне шагами по SWEEP_BATCH файлов.
+Если осиротевшими выглядят больше max_fraction отчётов, скорее всего подключена не та
+или пустая база: отчёты в таком проходе не удаляются. Разовый проход:
+
+    python -m src.sweeper --dry-run
+"""
+import argparse
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+from src.config import PDF_CACHE_DIR, SWEEP_BATCH, SWEEP_GRACE, SWEEP_MAX_FRACTION
+from src.database import Database
+
+
+MEDIA_DIR = "media"
+TMP_DIR = "tmp"
+# Файлы /without_logs не сохраняются в БД, их сборщик не трогает
+REPORT_PREFIX = "report_"
+
+
+class MediaSweeper:
+    """Сверка файлов с report_link; проход по каталогам разбит на шаги по batch файлов"""
+
+    def __init__(
+            self,
+            db: Database,
+            media_dir: str = MEDIA_DIR,
+            tmp_dir: str = TMP_DIR,
+            cache_dir: str = PDF_CACHE_DIR,
+            batch: int = SWEEP_BATCH,
+            grace: float = SWEEP_GRACE,
+            max_fraction: float = SWEEP_MAX_FRACTION,
+            dry_run: bool = False
+    ):
+        self.db = db
+        self.media_dir = media_dir
+        self.tmp_dir = tmp_dir
+        self.cache_dir = cache_dir
+        self.batch = batch
+        self.grace = grace
+        self.max_fraction = max_fraction
+        self.dry_run = dry_run
+        self._pending: List[str] = []
+        self._linked = set()
+        self._keep_reports = False
+        self._stats = self._new_stats()
+
+    @staticmethod
+    def _new_stats() -> Dict[str, Any]:
+        return {"checked": 0, "removed": 0, "reclaimed_bytes": 0, "reports_kept": False}
+
+    def _list_files(self) -> List[str]:
+        files = []
+        for directory in (self.media_dir, self.cache_dir, self.tmp_dir):
+            if not os.path.isdir(directory):
+                continue
+            with os.scandir(directory) as entries:
+                files.extend(entry.path for entry in entries if entry.is_file(follow_symlinks=False))
+        return sorted(files)
+
+    def _is_report(self, path: str) -> bool:
+        directory, name = os.path.split(path)
+        return (
+            os.path.normpath(directory) == os.path.normpath(self.media_dir)
+            and name.startswith(REPORT_PREFIX)
+            and name.endswith(".pdf")
+        )
+
+    def _is_garbage(self, path: str) -> bool:
+        directory, name = os.path.split(path)
+        if os.path.normpath(directory) == os.path.normpath(self.tmp_dir) or name.endswith(".tmp"):
+            return True
+        return not self._keep_reports and self._is_report(path) and name not in self._linked
+
+    def _check_orphans(self) -> bool:
+        """Не слишком ли много отчётов без ссылки: тогда база, скорее всего, не та, и отчёты не удаляются"""
+        reports = [os.path.basename(path) for path in self._pending if self._is_report(path)]
+        orphans = sum(name not in self._linked for name in reports)
+        if reports and orphans > self.max_fraction * len(reports):
+            logging.warning(
+                'Очистка media: без ссылки в БД %s из %s отчётов, больше допустимой доли %s - '
+                'отчёты не удаляются, проверьте DATABASE_URL', orphans, len(reports), self.max_fraction
+            )
+            return True
+        return False
+
+    def step(self) -> Optional[Dict[str, Any]]:
+        """
+        Обработка очередных batch файлов.
+
+        Возвращает итоги прохода, когда он завершён, иначе None. Список ссылок читается
+        из БД один раз в начале прохода; файлы моложе grace пропускаются, поэтому
+        отчёт, сгенерированный после этого, не будет принят за осиротевший.
+        """
+        if not self._pending:
+            self._linked = self.db.linked_filenames()
+            self._pending = self._list_files()
+            self._stats = self._new_stats()
+            self._keep_reports = self._check_orphans()
+            self._stats["reports_kept"] = self._keep_reports
+
+        now = time.time()
+        batch, self._pending = self._pending[:self.batch], self._pending[self.batch:]
+        for path in batch:
+            self._stats["checked"] += 1
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            if now - stat.st_mtime < self.grace or not self._is_garbage(path):
+                continue
+            if not self.dry_run:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    continue
+            self._stats["removed"] += 1
+            self._stats["reclaimed_bytes"] += stat.st_size
+
+        if self._pending:
+            return None
+        stats, self._stats = self._stats, self._new_stats()
+        if stats["removed"]:
+            logging.info(
+                'Очистка media: удалено файлов %s, освобождено %s байт (проверено %s)',
+                stats["removed"], stats["reclaimed_bytes"], stats["checked"]
+            )
+        return stats
+
+    def sweep(self) -> Dict[str, Any]:
+        """Полный проход за один вызов"""
+        self._pending = []
+        while True:
+            stats = self.step()
+            if stats is not None:
+                return stats
+
+    async def run(self, interval: float):
+        """Фоновая очистка: шаг раз в interval секунд, в отдельном потоке"""
+        while True:
+            try:
+                await asyncio.to_thread(self.step)
+            except Exception:
+                logging.exception('Ошибка при очистке media')
+            await asyncio.sleep(interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Очистка media/ и tmp/ от файлов без записи в БД")
+    parser.add_argument("--dry-run", action="store_true", help="только показать, сколько будет удалено")
+    parser.add_argument("--grace", type=float, default=SWEEP_GRACE, help="минимальный возраст файла, с")
+    parser.add_argument(
+        "--max-fraction", type=float, default=SWEEP_MAX_FRACTION,
+        help="допустимая доля отчётов без ссылки в БД; 1 - удалять при любой доле"
+    )
+    args = parser.parse_args()
+
+    db = Database()
+    try:
+        stats = MediaSweeper(db, grace=args.grace, max_fraction=args.max_fraction, dry_run=args.dry_run).sweep()
+    finally:
+        db.close()
+    action = "Будет удалено" if args.dry_run else "Удалено"
+    print(f"{action} файлов: {stats['removed']}, {stats['reclaimed_bytes']} байт (проверено {stats['checked']})")
+    if stats["reports_kept"]:
+        print("Отчёты не удалялись: без ссылки в БД слишком большая их доля (см. --max-fraction)")
+
+
+if __name__ == "__main__":
+    main()
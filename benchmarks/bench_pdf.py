@@ -0,0 +1,155 @@
+"""
+Бенчмарк генераторов PDF: отчётов (backend_reports) и писем (backend_congrats).
+
+Каждый случай запускается в отдельном процессе, чтобы пиковый RSS относился только к нему.
+Процесс прогревается (warm_up), затем генерирует документ --repeat раз; в результатах p50/p95
+времени генерации и её этапов, пиковый RSS и размер PDF. Запускать из корня репозитория
+с зависимостями обоих сервисов:
+
+    python -m benchmarks.bench_pdf --save-baseline benchmarks/baseline.json
+    python -m benchmarks.bench_pdf --compare benchmarks/baseline.json
+
+Базовые замеры зависят от машины, поэтому сравнивать имеет смысл с baseline, снятым на ней же.
+С --compare код выхода 1, если p50 какого-либо случая вырос больше чем на --tolerance.
+"""
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+
+from benchmarks.fixtures import LETTER_TYPES, REPORT_SIZES, letter_fixture, report_fixture
+
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+SERVICE_DIRS = {
+    "reports": ROOT_DIR / "backend_reports",
+    "congrats": ROOT_DIR / "backend_congrats",
+}
+
+
+def all_cases():
+    cases = [f"reports/{size}" for size in REPORT_SIZES]
+    cases.extend(f"congrats/{entity_type}" for entity_type in LETTER_TYPES)
+    return cases
+
+
+def percentile(values, q):
+    """Перцентиль методом ближайшего ранга"""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+def peak_rss_bytes():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux отдаёт килобайты, macOS - байты
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+def run_case(case, repeat, chart_format):
+    """Выполняется в отдельном процессе: импорт нужного сервиса, прогрев и repeat генераций"""
+    service, name = case.split("/")
+    sys.path.insert(0, str(SERVICE_DIRS[service]))
+    if service == "reports":
+        from src.pdf_creater import generate_pdf_report, warm_up
+        data = report_fixture(REPORT_SIZES[name])
+        render = lambda output: generate_pdf_report(data, output, chart_format=chart_format)
+    else:
+        from app.pdf_creater import generate_pdf_report, warm_up
+        data = letter_fixture(name)
+        render = lambda output: generate_pdf_report(data, output)
+
+    warm_up()
+    totals = []
+    stages = defaultdict(list)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        output = os.path.join(tmp_dir, "out.pdf")
+        for _ in range(repeat):
+            started = time.perf_counter()
+            timings = render(output)
+            totals.append(time.perf_counter() - started)
+            for stage, seconds in timings.items():
+                if stage != "total":
+                    stages[stage].append(seconds)
+        size = os.path.getsize(output)
+
+    return {
+        "p50": percentile(totals, 50),
+        "p95": percentile(totals, 95),
+        "stages_p50": {stage: percentile(values, 50) for stage, values in stages.items()},
+        "peak_rss_bytes": peak_rss_bytes(),
+        "pdf_bytes": size,
+        "repeat": repeat,
+    }
+
+
+def run(cases, repeat, chart_format):
+    context = multiprocessing.get_context("spawn")
+    results = {}
+    for case in cases:
+        with context.Pool(1, maxtasksperchild=1) as pool:
+            results[case] = pool.apply(run_case, (case, repeat, chart_format))
+        print_result(case, results[case])
+    return results
+
+
+def print_result(case, result):
+    stages = ", ".join(f"{stage} {seconds * 1000:.0f}" for stage, seconds in result["stages_p50"].items())
+    print(
+        f"{case:<22} p50 {result['p50'] * 1000:8.1f} мс  p95 {result['p95'] * 1000:8.1f} мс  "
+        f"RSS {result['peak_rss_bytes'] / 2 ** 20:7.1f} МБ  PDF {result['pdf_bytes'] / 1024:8.1f} КБ  "
+        f"[{stages}]"
+    )
+
+
+def compare(results, baseline, tolerance):
+    """Сравнение с baseline; возвращает список случаев, где p50 вырос больше допустимого"""
+    regressions = []
+    print(f"\n{'случай':<22} {'p50 было':>10} {'p50 стало':>10} {'изм.':>8} {'RSS изм.':>9} {'PDF изм.':>9}")
+    for case, result in results.items():
+        base = baseline.get(case)
+        if not base:
+            print(f"{case:<22} нет в baseline")
+            continue
+        change = result["p50"] / base["p50"] - 1
+        rss_change = result["peak_rss_bytes"] / base["peak_rss_bytes"] - 1
+        size_change = result["pdf_bytes"] / base["pdf_bytes"] - 1
+        mark = "  РЕГРЕССИЯ" if change > tolerance else ""
+        print(
+            f"{case:<22} {base['p50'] * 1000:8.1f}мс {result['p50'] * 1000:8.1f}мс {change:+8.1%} "
+            f"{rss_change:+9.1%} {size_change:+9.1%}{mark}"
+        )
+        if change > tolerance:
+            regressions.append(case)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк генерации PDF отчётов и писем")
+    parser.add_argument("--cases", nargs="+", choices=all_cases(), default=all_cases())
+    parser.add_argument("--repeat", type=int, default=10, help="генераций на случай")
+    parser.add_argument("--chart-format", choices=("png", "svg"), default="png")
+    parser.add_argument("--save-baseline", type=Path, help="сохранить результаты в файл")
+    parser.add_argument("--compare", type=Path, help="сравнить с сохранёнными результатами")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="допустимый рост p50, доля")
+    args = parser.parse_args()
+
+    results = run(args.cases, args.repeat, args.chart_format)
+
+    if args.save_baseline:
+        args.save_baseline.write_text(json.dumps(results, indent=2, ensure_ascii=False), encoding="utf-8")
+        print(f"\nBaseline сохранён в {args.save_baseline}")
+    if args.compare:
+        baseline = json.loads(args.compare.read_text(encoding="utf-8"))
+        if compare(results, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
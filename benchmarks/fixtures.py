@@ -0,0 +1,88 @@
+"""Синтетические данные для бенчмарка: отчёты LDPRReport разного объёма и письма обоих типов"""
+import json
+from pathlib import Path
+
+
+CONGRATS_DIR = Path(__file__).resolve().parent.parent / "backend_congrats"
+
+# Множитель объёма: число законопроектов, примеров обращений, проектов СВО, поручений и абзацев other_info
+REPORT_SIZES = {
+    "small": 1,
+    "medium": 10,
+    "large": 40,
+    "xlarge": 120,
+}
+LETTER_TYPES = ("individual", "legal_entity")
+
+REQUEST_CATEGORIES = (
+    "utilities", "pensions_and_social_payments", "improvement", "education", "svo", "road_maintenance",
+    "ecology", "medicine_and_healthcare", "public_transport", "illegal_dumps", "appeals_to_ldpr_chairman",
+    "legal_aid_requests", "integrated_territory_development", "stray_animal_issues", "legislative_proposals",
+)
+PARAGRAPH = (
+    "Депутат провёл встречу с жителями округа, обсудил ремонт дворовых территорий, "
+    "работу общественного транспорта и благоустройство парков; по итогам направлены запросы "
+    "в администрацию района и профильные ведомства."
+)
+
+
+def report_fixture(scale: int) -> dict:
+    """Отчёт, в котором все списки содержат scale элементов"""
+    links = [f"https://example.ru/news/{i}" for i in range(3)]
+    return {
+        "general_info": {
+            "full_name": "Иванов Иван Иванович",
+            "district": "Одномандатный избирательный округ № 7",
+            "term_start": "2021",
+            "term_end": "2026",
+            "links": links,
+            "position": "Депутат",
+            "committees": [f"Комитет по вопросам № {i}" for i in range(1, 4)],
+            "sessions_attended": {
+                "total": "24", "attended": "22",
+                "committee_total": "12", "committee_attended": "11",
+                "ldpr_total": "6", "ldpr_attended": "6",
+            },
+            "region": "Московская область",
+            "authority_name": "Московская областная дума",
+            "ldpr_position": "Руководитель фракции",
+        },
+        "legislation": [
+            {
+                "title": f"О внесении изменений в закон № {i}",
+                "summary": PARAGRAPH,
+                "status": ("Принят", "На рассмотрении", "Отклонён")[i % 3],
+                "rejection_reason": "Отрицательное заключение правительства" if i % 3 == 2 else None,
+                "links": links[:1],
+            }
+            for i in range(scale)
+        ],
+        "citizen_requests": {
+            "personal_meetings": str(12 * scale),
+            "requests": {category: str((i * 7 + 3) * scale) for i, category in enumerate(REQUEST_CATEGORIES)},
+            "responses": str(30 * scale),
+            "official_queries": str(5 * scale),
+            "examples": [{"text": PARAGRAPH, "links": links[:1]} for _ in range(scale)],
+            "citizen_day_receptions": {"2025-03": 2 * scale, "2025-04": scale},
+        },
+        "svo_support": {
+            "projects": [
+                {"name": f"Помощь участникам СВО № {i}", "links": links[:2], "text": PARAGRAPH}
+                for i in range(scale)
+            ]
+        },
+        "project_activity": [{"name": f"Проект № {i}", "result": PARAGRAPH} for i in range(scale)],
+        "ldpr_orders": [{"instruction": f"Поручение № {i}", "action": PARAGRAPH} for i in range(scale)],
+        "other_info": "\n".join(PARAGRAPH for _ in range(scale)),
+    }
+
+
+def letter_fixture(entity_type: str) -> dict:
+    """Письмо в том виде, в каком его получает generate_pdf_report сервиса поздравлений"""
+    with open(CONGRATS_DIR / "data_example.json", encoding="utf-8") as file:
+        sender = json.load(file)["sender"]
+    if entity_type == "individual":
+        recipient = {"lastName": "Петров", "firstName": "Пётр", "middleName": "Петрович", "gender": "male"}
+    else:
+        recipient = {"companyName": "ООО «Ромашка»"}
+    return {"entityType": entity_type, "date": "07.08.2025", "recipient": recipient, "sender": sender}
@@ -9,6 +9,17 @@ export interface PdfResponse {
   message: string; // URL к PDF файлу
 }
 
+interface ReportJob {
+  job_id: string;
+  status: 'queued' | 'rendering' | 'done' | 'failed';
+  report_link: string | null;
+  error: string | null;
+}
+
+const JOB_POLL_INTERVAL_MS = 1500;
+// Генерация с ожиданием в очереди укладывается в несколько минут; дольше - задача зависла
+const JOB_TIMEOUT_MS = 5 * 60 * 1000;
+
 class ReportApiService {
   private baseURL = 'https://депутатлдпр.рф';
 
@@ -49,13 +60,37 @@ class ReportApiService {
       }
 
       const data = await response.json();
-      return data;
+      return await this.waitForJob(data.job_id);
     } catch (error: any) {
       console.error('Ошибка при создании PDF:', error);
       throw error;
     }
   }
 
+  // Отчёт генерируется в фоне: опрашиваем статус задачи до готовности, но не дольше JOB_TIMEOUT_MS
+  private async waitForJob(jobId: string): Promise<PdfResponse> {
+    const deadline = Date.now() + JOB_TIMEOUT_MS;
+    while (Date.now() < deadline) {
+      await new Promise(resolve => setTimeout(resolve, JOB_POLL_INTERVAL_MS));
+      const response = await fetch(`${this.baseURL}/api/reports/jobs/${jobId}`, {
+        headers: this.getHeaders(),
+      });
+
+      if (!response.ok) {
+        throw new Error(`HTTP error ${response.status}`);
+      }
+
+      const job: ReportJob = await response.json();
+      if (job.status === 'done' && job.report_link) {
+        return { status: 'Success', message: job.report_link };
+      }
+      if (job.status === 'failed') {
+        throw new Error(job.error || 'Не удалось сформировать отчёт');
+      }
+    }
+    throw new Error('Отчёт формируется слишком долго, попробуйте позже');
+  }
+
   // Метод для скачивания PDF по URL
   async downloadPdf(pdfUrl: string, filename?: string): Promise<void> {
     try {
@@ -228,11 +228,30 @@ export const getUserById = async (userId: string): Promise<User> => {
 };
 
 // Admin Reports API
+interface ReportsPage {
+  items: Report[];
+  next_cursor: string | null;
+}
+
+const REPORTS_PAGE_SIZE = 500;
+
 export const getAllReports = async (): Promise<Report[]> => {
-  const response = await fetchWithAuth(`${BASE_URL}/api/reports/all`, {
-    headers: getAuthHeaders(),
-  });
-  return await handleApiResponse(response);
+  // /api/reports/all отдаёт отчёты постранично, собираем все страницы по next_cursor
+  const reports: Report[] = [];
+  let cursor: string | null = null;
+  do {
+    const params = new URLSearchParams({ limit: String(REPORTS_PAGE_SIZE) });
+    if (cursor) {
+      params.set('cursor', cursor);
+    }
+    const response = await fetchWithAuth(`${BASE_URL}/api/reports/all?${params}`, {
+      headers: getAuthHeaders(),
+    });
+    const page: ReportsPage = await handleApiResponse(response);
+    reports.push(...page.items);
+    cursor = page.next_cursor;
+  } while (cursor);
+  return reports;
 };
 
 export const getReportById = async (id: string): Promise<Report> => {
@@ -35,6 +35,13 @@ export interface Report {
   user_id: number;
   report_link: string;
   created_at: string;
+  status?: 'queued' | 'rendering' | 'done' | 'failed';
+  region?: string;
+  full_name?: string;
+  authority_name?: string;
+  requests_total?: number;
+  sessions_total?: number;
+  sessions_attended?: number;
   data?: LDPRReport;
 }
 
@@ -8,8 +8,8 @@ from aiogram import Bot, types
 from asgiref.sync import async_to_sync
 
 from src.celery_app import app
-from src.config import BOT_TOKEN, CHAT_ID, INFO_LOG_CHAT_ID, ERROR_LOG_CHAT_ID
-from src.services.user import create_user
+from src.config import BOT_TOKEN, CHAT_ID, INFO_LOG_CHAT_ID, ERROR_LOG_CHAT_ID, BASE_URL
+from src.services.user import create_user, check_user_is_available
 from src.database import get_db
 
 logger = logging.getLogger(__name__)
@@ -19,6 +19,19 @@ def get_bot():
     return Bot(BOT_TOKEN)
 
 
+def format_report_reference(extra: Dict[str, Any]) -> str:
+    """Лог backend_reports со ссылкой на отчёт (schema report_ref/1): данные открываются в админке"""
+    lines = [
+        f"ID отчёта: {extra['record_id']}, пользователь: {extra.get('user_id')}",
+        f"Данные: {extra['size']} байт, sha256 {extra['sha256'][:16]}",
+    ]
+    if extra.get('error'):
+        lines.append(f"Ошибка: {extra['error']}")
+    if BASE_URL:
+        lines.append(f"Открыть отчёт: {BASE_URL}seasonal_report/view_report/{extra['record_id']}")
+    return "\n".join(lines)
+
+
 @app.task()
 def accept_deputat(user_id: int) \
         -> Dict[str, Any]:
@@ -95,9 +108,35 @@ def send_log_to_telegram(log_data):
             chat_id = INFO_LOG_CHAT_ID
             if log_data['level'] == 'ERROR' and ERROR_LOG_CHAT_ID:
                 chat_id = ERROR_LOG_CHAT_ID
+            if log_data.get('custom_chat_id'):
+                # Адресное уведомление (например, ссылка на готовый отчёт) - без json-вложения,
+                # и только подтверждённому пользователю бота, а не в любой чат
+                custom_chat_id = log_data['custom_chat_id']
+                with get_db() as session:
+                    allowed = check_user_is_available(session, custom_chat_id)
+                if not allowed:
+                    logger.warning(f"Notification to unknown chat {custom_chat_id} dropped")
+                    return
+                await bot.send_message(chat_id=custom_chat_id, text=log_data['message'])
+                return
             if not chat_id:
                 logger.warning(f"Cannot send log to Telegram: no chat id defined")
                 return
+            message = log_data['message']
+            if len(message) > 2000:
+                message = message[:2000]
+
+            extra = log_data.get('extra') or {}
+            if 'record_id' in extra:
+                # Отчёт целиком не пересылается: вместо json-вложения короткое сообщение со ссылкой
+                await bot.send_message(chat_id=chat_id, text=f"""
+{log_data['log_id']}
+[{log_data['level']}]
+{message}
+
+{format_report_reference(extra)}""")
+                return
+
             json_data = json.dumps(log_data, indent=2, ensure_ascii=False)
 
             # Создаем временный файл в памяти
@@ -105,9 +144,6 @@ def send_log_to_telegram(log_data):
                 json_data.encode('utf-8'),
                 filename=f"log{chat_id}.json"
             )
-            message = log_data['message']
-            if len(message) > 2000:
-                message = message[:2000]
             await bot.send_document(chat_id=chat_id, document=file, caption=f"""
 {log_data['log_id']}
 [{log_data['level']}]